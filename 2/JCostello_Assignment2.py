@@ -1,6 +1,5 @@
-import copy, math, time
+import copy, hashlib, heapq, itertools, json, math, multiprocessing, sys, time
 import numpy as np
-from tqdm import tqdm
 
 # parent node class
 class Node:   
@@ -64,12 +63,156 @@ class Replace(Node):
         return self.str.interpret(env).replace(self.old.interpret(env), self.new.interpret(env), 1)
 
 
+# version space of one input-output pair
+class VersionSpace:
+    '''
+    Graph of the programs producing the output of one input-output pair.
+    Each reachable string maps to the ways of building it: a terminal, a
+    'replace' of another string with terminal 'old' and 'new' arguments, or
+    a 'concat' of two strings.
+    '''
+    def __init__(self, terminals, io, depth):
+        '''
+
+        Parameters
+        ----------
+        terminals : dict
+            grammar keys and 'Node' classes of the terminals.
+        io : dict
+            the input-output pair.
+        depth : integer
+            number of 'replace' steps applied to the terminals when building
+            the strings a 'replace' may start from.
+
+        '''
+        out = io['out']
+        self.values = {key: t.interpret(io) for key,t in terminals.items()}
+        max_len = max([len(out)] + [len(v) for v in self.values.values()])
+        # strings reachable from the terminals with a few 'replace' steps
+        universe = set(self.values.values())
+        frontier = set(universe)
+        for _ in range(depth):
+            new_frontier = set()
+            for string in frontier:
+                for old in self.values.values():
+                    for new in self.values.values():
+                        result = string.replace(old, new, 1)
+                        if len(result) <= max_len and result not in universe:
+                            new_frontier.add(result)
+            universe |= new_frontier
+            frontier = new_frontier
+        # and every part of the output for 'concat'
+        for i in range(len(out) + 1):
+            for j in range(i, len(out) + 1):
+                universe.add(out[i:j])
+        
+        # ways of building each string
+        self.graph = {string: [] for string in universe}
+        for key, value in self.values.items():
+            self.graph[value].append(('term', key))
+        for string in universe:
+            for old_key, old in self.values.items():
+                for new_key, new in self.values.items():
+                    result = string.replace(old, new, 1)
+                    if result in self.graph:
+                        self.graph[result].append(('replace', string, old_key, new_key))
+            for k in range(len(string) + 1):
+                if string[:k] in self.graph and string[k:] in self.graph:
+                    self.graph[string].append(('concat', string[:k], string[k:]))
+        
+        # keep only strings some program can build
+        realizable = set(self.values.values())
+        changed = True
+        while changed:
+            changed = False
+            for string, alts in self.graph.items():
+                if string in realizable:
+                    continue
+                for alt in alts:
+                    if alt[0] == 'replace' and alt[1] in realizable or \
+                       alt[0] == 'concat' and alt[1] in realizable and alt[2] in realizable:
+                        realizable.add(string)
+                        changed = True
+                        break
+        for string in list(self.graph.keys()):
+            if string not in realizable:
+                del self.graph[string]
+                continue
+            self.graph[string] = [alt for alt in self.graph[string]
+                                  if alt[0] == 'term' or alt[1] in realizable and
+                                  (alt[0] == 'replace' or alt[2] in realizable)]
+
+
+# search event sinks
+class EventSink:
+    '''
+    Receives the events of a search and ignores them. Events are a name and
+    keyword fields:
+        'level_start'      cost
+        'level_end'        cost, seconds, stored, evaluated, pruned, cut
+        'partial_solution' program, solved (bitmask of the input-output
+                           pairs solved, bit i for pair i)
+        'grammar_update'   grammar_costs
+        'solution'         program (None if not found), seconds, evaluated,
+                           pruned, cut
+    Searches of a BatchGBUS also send their 'task' index.
+    '''
+    def emit(self, event, **fields):
+        pass
+
+class PrintSink(EventSink):
+    '''
+    Human-readable events on a stream.
+    '''
+    def __init__(self, stream=None):
+        self.stream = sys.stdout if stream is None else stream
+    
+    def emit(self, event, **fields):
+        task = f"[task {fields['task']}] " if 'task' in fields else ''
+        if event == 'level_start':
+            line = f"cost {fields['cost']}"
+        elif event == 'level_end':
+            line = f"cost {fields['cost']} done in {fields['seconds']:.3f}s, {fields['stored']} stored"
+        elif event == 'partial_solution':
+            line = f"solved {fields['solved']:#b}\n{task}{fields['program'].toString()}"
+        elif event == 'grammar_update':
+            line = f"updating grammar costs\n{task}{fields['grammar_costs']}"
+        elif event == 'solution':
+            program = 'none' if fields['program'] is None else fields['program'].toString()
+            line = f"solution {program} in {fields['seconds']:.3f}s"
+        else:
+            line = f'{event} {fields}'
+        print(task + line, file=self.stream)
+
+class JsonLinesSink(EventSink):
+    '''
+    One JSON object per event, with its name under 'event'. Programs are
+    written with 'toString'.
+    '''
+    def __init__(self, stream):
+        self.stream = stream
+    
+    def emit(self, event, **fields):
+        record = {'event': event}
+        for key, value in fields.items():
+            if isinstance(value, Node):
+                value = value.toString()
+            elif isinstance(value, np.integer):
+                value = int(value)
+            record[key] = value
+        self.stream.write(json.dumps(record) + '\n')
+
+
 # guided bottom-up search
 class GBUS:
     '''
     Guided bottom-up search class.
     '''
-    def __init__(self, grammar, in_out, bound, pcfg_start='equal', update_pcfg=True):
+    def __init__(self, grammar, in_out, bound, pcfg_start='equal', update_pcfg=True, pcfg_file=None,
+                 prune_noops=True, output_digest=False, digest_check=False,
+                 max_str_len=None, max_bank_chars=None, n_workers=1,
+                 search='bottom_up', vs_depth=8, vs_max_nodes=1000000, events=None,
+                 columnar=False):
         '''
 
         Parameters
@@ -80,10 +223,50 @@ class GBUS:
             input-output pairs we are looking to solve
         bound : integer
             maximum program cost to check
-        pcfg_start : string (either 'equal' or 'final')
-            how to start the probabilistic CFG
+        pcfg_start : string (either 'equal', 'final' or 'learned')
+            how to start the probabilistic CFG. 'learned' loads the grammar
+            costs saved to pcfg_file by 'save_pcfg' or 'combine_pcfg'
         update_pcfg : boolean
             whether to update the PCFG
+        pcfg_file : string OR None
+            path of the learned grammar costs (only used if pcfg_start is
+            'learned')
+        prune_noops : boolean
+            whether to skip 'replace' and 'concat' programs that behave like
+            one of their own arguments on every example
+        output_digest : boolean
+            whether to key the equivalence set by a 128-bit hash of the
+            output tuple instead of the tuple itself
+        digest_check : boolean
+            whether to compare full outputs when a hash is already stored
+            (only used if output_digest is True)
+        max_str_len : integer OR None
+            new programs with a longer output string on any input-output pair
+            are discarded. The grammar terminals are always kept. None for no
+            limit
+        max_bank_chars : integer OR None
+            programs are discarded once the outputs stored in the program
+            list would exceed this many characters. None for no limit
+        n_workers : integer
+            number of processes used to evaluate each cost level. Results are
+            the same as with a single process
+        search : string (either 'bottom_up' or 'version_space')
+            'bottom_up' enumerates programs by cost. 'version_space' splits
+            the outputs top-down and returns the cheapest consistent program
+            whose 'replace' arguments 'old' and 'new' are terminals
+        vs_depth : integer
+            'replace' steps from the terminals considered as the input of a
+            'replace' (only used if search is 'version_space')
+        vs_max_nodes : integer
+            limit on the intersected version space size (only used if search
+            is 'version_space')
+        events : 'EventSink' OR None
+            receives the search events. None for an 'EventSink', which does
+            no I/O
+        columnar : boolean
+            whether to compute the outputs of each cost bucket at once from
+            its arguments' outputs stored as arrays over the input-output
+            pairs, instead of interpreting each program. Results are the same
 
         Returns
         -------
@@ -92,7 +275,9 @@ class GBUS:
         
         '''
         # ensure pcfg_start given is correct
-        assert pcfg_start in ['equal', 'final']
+        assert pcfg_start in ['equal', 'final', 'learned']
+        assert pcfg_start != 'learned' or pcfg_file is not None
+        assert search in ['bottom_up', 'version_space']
         # grammar selfs
         self.grammar = grammar
         # other selfs
@@ -100,15 +285,41 @@ class GBUS:
         self.bound = bound
         self.pcfg_start = pcfg_start
         self.update_pcfg = update_pcfg
+        self.pcfg_file = pcfg_file
+        self.prune_noops = prune_noops
+        self.output_digest = output_digest
+        self.digest_check = digest_check
+        self.max_str_len = max_str_len
+        self.max_bank_chars = max_bank_chars
+        self.n_workers = n_workers
+        self.search = search
+        self.vs_depth = vs_depth
+        self.vs_max_nodes = vs_max_nodes
+        self.events = EventSink() if events is None else events
+        self.columnar = columnar
+        # fields sent with every event
+        self.event_fields = {}
+    
+    def emit(self, event, **fields):
+        self.events.emit(event, **self.event_fields, **fields)
+    
+    # record the search result, None if not found
+    def found_solution(self, prog):
+        self.solution = prog
+        self.emit('solution', program=prog, seconds=time.time() - self.start_time,
+                  evaluated=self.total_progs_eval, pruned=self.total_progs_pruned,
+                  cut=self.total_progs_cut)
+    
+    # whether a program gives the expected output on every input-output pair
+    def solves(self, prog):
+        return all(prog.interpret(io) == io['out'] for io in self.in_out)
     
     def true_init(self):
         # initial grammar costs
         if self.update_pcfg == True:
             pcfg_probs = np.ones(len(self.grammar)) / len(self.grammar)
-            self.solved_subsets = set()
-            self.solved_subsets.add( (0,) * len(in_out) )
         elif self.update_pcfg == False:
-            if self.pcfg_start == 'equal':
+            if self.pcfg_start in ['equal', 'learned']:
                 pcfg_probs = np.ones(len(self.grammar)) / len(self.grammar)
             elif self.pcfg_start == 'final':
                 pcfg_probs = np.array([0.188] * 5 + [0.059])
@@ -116,32 +327,52 @@ class GBUS:
         self.grammar_costs = {}
         for i,rule_str in enumerate(self.grammar.keys()):
             self.grammar_costs[rule_str] = round(-math.log2(pcfg_probs[i]))
+        # largest fraction of input-output pairs solved by a partial
+        # solution using each rule
+        self.max_occ = dict.fromkeys(self.grammar.keys(), 0)
+        # partial solutions from earlier runs
+        self.learned_solutions = []
+        if self.pcfg_start == 'learned':
+            self.load_pcfg(self.pcfg_file)
         # correct tuple solution
         self.correct_tuple = tuple()
         for io in self.in_out:
             self.correct_tuple += (io['out'],)
-        # list of partial solutions
-        self.partial_solutions = []
+        # partial solutions keyed by the bitmask of input-output pairs they
+        # solve. Cost levels go cheapest first, so the first program found
+        # for a bitmask is the cheapest
+        self.partial_solutions = {}
+        # program solving all input-output pairs
+        self.solution = None
         # total programs evaluated
         self.total_progs_eval = 0
+        # total programs pruned before evaluation
+        self.total_progs_pruned = 0
+        # total programs discarded for exceeding the size limits
+        self.total_progs_cut = 0
+        self.start_time = time.time()
     
     # main search loop
     def run_search(self):
         self.true_init()
+        if self.search == 'version_space':
+            self.found_solution(self.version_space_search())
+            return self.solution
         soln = False
         # soln will be None if bound is reached
         while soln is not None:
             prog, soln = self.guided_search()
             # if a solution is found solving all input-output pairs
             if soln == True:
+                self.found_solution(prog)
                 return prog
             # update the PCFG probabilities and costs
             elif soln == False and self.update_pcfg == True:
-                print('updating grammar costs')
                 self.update_grammar_costs()
+        self.found_solution(None)
     
     # evaluate a program
-    def evaluate_program(self, p, update_plist=True):
+    def evaluate_program(self, p, update_plist=True, outputs=None, solved=None):
         '''
 
         Parameters
@@ -150,6 +381,11 @@ class GBUS:
             program to evaluate.
         update_plist : boolean, optional
             whether the program list should be updated. The default is True.
+        outputs : tuple of strings, optional
+            outputs of the program if already computed. The default is None.
+        solved : integer, optional
+            bitmask of the input-output pairs solved by the program if
+            already computed. The default is None.
 
         Returns
         -------
@@ -162,35 +398,100 @@ class GBUS:
         '''
         # program outputs for equivalence checking
         out_tuple = tuple()
-        # which subset of the input-output pairs this program solves
-        solved_subset_tuple = tuple()
+        # bitmask of the input-output pairs this program solves
+        solved_mask = 0
         # check if outputs are solved correctly
         for idx, io in enumerate(self.in_out):
-            out_tuple += (p.interpret(io),)
-            if self.update_pcfg == True:
-                # 1 if solved, 0 if not solved
+            if outputs is None:
+                out = p.interpret(io)
+            else:
+                out = outputs[idx]
+            # the initial programs are in the program list already, so only
+            # new programs are cut
+            if update_plist == True and self.max_str_len is not None and len(out) > self.max_str_len:
+                self.total_progs_cut += 1
+                return (None, False)
+            if self.output_digest:
+                # share one copy of equal output strings per example
+                out = self.interned[idx].setdefault(out, out)
+            out_tuple += (out,)
+            if self.update_pcfg == True and solved is None:
                 if out_tuple[idx] == self.correct_tuple[idx]:
-                    solved_subset_tuple += (1,)
-                else:
-                    solved_subset_tuple += (0,)
+                    solved_mask |= 1 << idx
+        if solved is not None:
+            solved_mask = solved
+        # outputs of the program list, so new programs built from p can be
+        # pruned. The initial programs are in it already
+        if update_plist == False:
+            self.bank_outputs[id(p)] = out_tuple
         if out_tuple == self.correct_tuple:
             return (p, True)
         if self.update_pcfg == True:
             # check if solved subset is new
-            if solved_subset_tuple not in self.solved_subsets:
-                print(solved_subset_tuple)
-                print(p.toString())
-                self.solved_subsets.add(solved_subset_tuple)
-                self.partial_solutions.append((p, solved_subset_tuple))
+            if solved_mask != 0 and solved_mask not in self.partial_solutions:
+                self.emit('partial_solution', program=p, solved=solved_mask)
+                self.partial_solutions[solved_mask] = p
+                self.add_solved(p, bin(solved_mask).count('1'))
                 return (p, False)
         # check if outputs are not equivalent to any seen before
-        if out_tuple not in self.output:
-            self.total_progs_eval += 1
-            self.output.add(out_tuple)
-            if update_plist == True:
-                self.plist[self.current_cost].append(p)
+        key = self.output_key(out_tuple)
+        if self.has_output(out_tuple, key):
+            return (None, False)
+        # check if storing the outputs would go over the program list limit
+        out_chars = sum(len(out) for out in out_tuple)
+        if update_plist == True and self.max_bank_chars is not None:
+            if self.bank_chars + out_chars > self.max_bank_chars:
+                self.total_progs_cut += 1
+                return (None, False)
+        self.add_output(out_tuple, key)
+        self.total_progs_eval += 1
+        if update_plist == True:
+            self.plist[self.current_cost].append(p)
+            self.bank_outputs[id(p)] = out_tuple
+            self.bank_chars += out_chars
         return (None, False)
     
+    # add new outputs to the equivalence set
+    def add_output(self, out_tuple, key):
+        '''
+
+        Parameters
+        ----------
+        out_tuple : tuple of strings
+            outputs of the program on every input-output pair.
+        key : bytes OR tuple of strings
+            their key from 'output_key'.
+
+        '''
+        if not self.output_digest:
+            self.output.add(key)
+            return
+        # hash collision, fall back to the full output tuple as the key
+        if key in self.output:
+            key = out_tuple
+        # keep the outputs around only if collisions need checking
+        self.output[key] = out_tuple if self.digest_check else None
+    
+    # key of a program's outputs in the equivalence set
+    def output_key(self, out_tuple):
+        if not self.output_digest:
+            return out_tuple
+        # fixed-width key no matter how long the output strings are
+        digest = hashlib.blake2b(digest_size=16)
+        for out in out_tuple:
+            out_bytes = out.encode()
+            digest.update(len(out_bytes).to_bytes(8, 'little'))
+            digest.update(out_bytes)
+        return digest.digest()
+    
+    # whether equivalent outputs are already in the equivalence set
+    def has_output(self, out_tuple, key):
+        if key not in self.output:
+            return False
+        if not self.output_digest or not self.digest_check:
+            return True
+        return self.output[key] == out_tuple or out_tuple in self.output
+    
     def guided_search(self):
         '''
         
@@ -204,6 +505,13 @@ class GBUS:
             None if bound is exceeded.
 
         '''
+        (prog, soln) = self.start_search()
+        while prog is None and soln is not None:
+            (prog, soln) = self.search_level()
+        return (prog, soln)
+    
+    # fresh program list under the current grammar costs
+    def start_search(self):
         # initial program list
         self.plist = {}
         
@@ -218,37 +526,84 @@ class GBUS:
         # next loop cost
         self.current_cost = min(self.plist.keys())
         
+        # outputs of the programs in the program list, by program id. Kept
+        # here rather than on the nodes, which other searches on the same
+        # grammar share
+        self.bank_outputs = {}
+        # characters of output stored in the program list
+        self.bank_chars = 0
+        # outputs of finished cost levels as arrays, for 'columnar'
+        self.columns = {}
+        
         # outputs
-        self.output = set()
+        if self.output_digest:
+            self.output = {}
+            self.interned = [{} for _ in self.in_out]
+        else:
+            self.output = set()
         # loop over all programs in program list
         for key in self.plist.keys():
             for p in self.plist[key]:
                 (prog, soln) = self.evaluate_program(p, update_plist=False)
                 if prog is not None:
                     return (prog, soln)
-        
-        while self.current_cost <= self.bound:
-            # iterate over all combinations of sizes to find next smallest size
-            newsize_set = set()
-            for i in self.plist.keys():
-                for j in self.plist.keys():
-                    newsize_set.add(i + j + self.grammar_costs['concat'])
-                    for k in self.plist.keys():
-                        newsize_set.add(i + j + k + self.grammar_costs['replace'])
-            newsize_array = np.array(list(newsize_set))
-            self.old_cost = self.current_cost
-            self.current_cost = np.min(newsize_array[newsize_array > self.old_cost])
-            print(self.current_cost)
-            # iterate over new programs
-            self.plist[self.current_cost] = []
-            for p in self.new_programs():
-                (prog, soln) = self.evaluate_program(p)
+        return (None, False)
+    
+    # evaluate the next cost level, (None, None) if bound is exceeded
+    def search_level(self):
+        if self.current_cost > self.bound:
+            return (None, None)
+        # iterate over all combinations of sizes to find next smallest size
+        newsize_set = set()
+        for i in self.plist.keys():
+            for j in self.plist.keys():
+                newsize_set.add(i + j + self.grammar_costs['concat'])
+                for k in self.plist.keys():
+                    newsize_set.add(i + j + k + self.grammar_costs['replace'])
+        newsize_array = np.array(list(newsize_set))
+        self.old_cost = self.current_cost
+        self.current_cost = np.min(newsize_array[newsize_array > self.old_cost])
+        self.emit('level_start', cost=self.current_cost)
+        level_time = time.time()
+        (evaluated, pruned, cut) = (self.total_progs_eval, self.total_progs_pruned, self.total_progs_cut)
+        # iterate over new programs
+        self.plist[self.current_cost] = []
+        if self.n_workers > 1:
+            (prog, soln) = self.parallel_search_level()
+        else:
+            (prog, soln) = (None, False)
+            for (p, outputs, solved) in self.new_programs():
+                (prog, soln) = self.evaluate_program(p, outputs=outputs, solved=solved)
                 if prog is not None:
-                    return (prog, soln)
-        
-        return (None, None)
+                    break
+        self.emit('level_end', cost=self.current_cost, seconds=time.time() - level_time,
+                  stored=len(self.plist[self.current_cost]),
+                  evaluated=self.total_progs_eval - evaluated,
+                  pruned=self.total_progs_pruned - pruned, cut=self.total_progs_cut - cut)
+        return (prog, soln)
+
+    # programs of the current cost level with their outputs and solved
+    # subsets, or None for both if they need interpreting
+    def new_programs(self):
+        for sizes in self.cost_buckets():
+            if self.columnar:
+                for (idx, outputs, solved) in self.bucket_outputs(sizes):
+                    yield (self.build_program(sizes, idx), outputs, solved)
+            else:
+                for idx in self.bucket_programs(sizes):
+                    yield (self.build_program(sizes, idx), None, None)
+    
+    def cost_buckets(self):
+        '''
 
-    def new_programs(self):      
+        Returns
+        -------
+        list of tuples of integers
+            costs of the (input, old, new) arguments of 'replace' or the
+            (left, right) arguments of 'concat' for all programs of the
+            current cost, 'replace' first.
+
+        '''
         # find correct cost combinations for current total cost
         concat_set = set()
         concat_list = []
@@ -268,48 +623,702 @@ class GBUS:
                             replace_set.add(new_tuple)
                             replace_list.append(new_tuple)
         
-        # go through replace_set
-        for (size1,size2,size3) in tqdm(replace_list):
-            for i in self.plist[size1]:
-                for j in self.plist[size2]:
-                    for k in self.plist[size3]:
-                        yield Replace(i, j, k)
-                        yield Replace(i, k, j)
-                        yield Replace(j, i, k)
-                        yield Replace(j, k, i)
-                        yield Replace(k, i, j)
-                        yield Replace(k, j, i)
+        # each distinct ordering of the costs once, so equal cost buckets
+        # don't produce the same program twice
+        buckets = []
+        for sizes in replace_list + concat_list:
+            buckets += sorted(set(itertools.permutations(sizes)))
+        return buckets
+    
+    def bucket_programs(self, sizes):
+        '''
+
+        Parameters
+        ----------
+        sizes : tuple of integers
+            argument costs from 'cost_buckets'.
+
+        Yields
+        ------
+        tuple of integers
+            index of each argument in its program list.
+
+        '''
+        # outputs of the arguments, in program list order
+        outputs = {size: [self.bank_outputs[id(p)] for p in self.plist[size]] for size in sizes}
+        # go through replace
+        if len(sizes) == 3:
+            (size1,size2,size3) = sizes
+            for a, i in enumerate(outputs[size1]):
+                for b, j in enumerate(outputs[size2]):
+                    if self.prune_noops:
+                        # examples where 'old' occurs in the input string
+                        occurs = [idx for idx in range(len(self.in_out))
+                                  if j[idx] in i[idx]]
+                        # replace does nothing if 'old' never occurs
+                        if not occurs:
+                            self.total_progs_pruned += len(self.plist[size3])
+                            continue
+                    for c, k in enumerate(outputs[size3]):
+                        # replace does nothing if 'old' equals 'new' wherever it occurs
+                        if self.prune_noops and all(j[idx] == k[idx] for idx in occurs):
+                            self.total_progs_pruned += 1
+                            continue
+                        # output would be too long
+                        if self.max_str_len is not None and any(
+                                len(i[idx]) - len(j[idx]) + len(k[idx]) > self.max_str_len
+                                for idx in range(len(self.in_out)) if j[idx] in i[idx]):
+                            self.total_progs_cut += 1
+                            continue
+                        yield (a, b, c)
+        
+        # go through concat
+        else:
+            (size1,size2) = sizes
+            for a, i in enumerate(outputs[size1]):
+                # concat with an empty string does nothing
+                if self.prune_noops and not any(i):
+                    self.total_progs_pruned += len(self.plist[size2])
+                    continue
+                for b, j in enumerate(outputs[size2]):
+                    if self.prune_noops and not any(j):
+                        self.total_progs_pruned += 1
+                        continue
+                    # output would be too long
+                    if self.max_str_len is not None and any(
+                            len(x) + len(y) > self.max_str_len
+                            for (x, y) in zip(i, j)):
+                        self.total_progs_cut += 1
+                        continue
+                    yield (a, b)
+    
+    # outputs of a finished cost level, one row per program
+    def output_columns(self, size):
+        if size not in self.columns:
+            self.columns[size] = np.array([self.bank_outputs[id(p)] for p in self.plist[size]], dtype=str) \
+                .reshape(len(self.plist[size]), len(self.in_out))
+        return self.columns[size]
+    
+    def bucket_outputs(self, sizes):
+        '''
+        Columnar version of 'bucket_programs'. Pruning, size limits and
+        outputs of the whole bucket are computed with array string kernels.
+        
+        Parameters
+        ----------
+        sizes : tuple of integers
+            argument costs from 'cost_buckets'.
+        
+        Returns
+        -------
+        list of (tuple of integers, tuple of strings, integer)
+            index of each argument in its program list, outputs and bitmask
+            of solved input-output pairs of the programs in the bucket, in
+            enumeration order.
+        
+        '''
+        cols = [self.output_columns(size) for size in sizes]
+        if any(len(col) == 0 for col in cols):
+            return []
+        idx_blocks = []
+        out_blocks = []
+        # go through replace, one input string at a time
+        if len(sizes) == 3:
+            (strs, olds, news) = cols
+            old_lens = np.char.str_len(olds)[:, None, :]
+            new_lens = np.char.str_len(news)[None, :, :]
+            for a in range(len(strs)):
+                # (old, example) where 'old' occurs in the input string
+                occurs = np.char.find(strs[a][None, :], olds) >= 0
+                keep = np.ones((len(olds), len(news)), dtype=bool)
+                if self.prune_noops:
+                    # replace does nothing if 'old' never occurs
+                    never = ~occurs.any(axis=1)
+                    self.total_progs_pruned += int(never.sum()) * len(news)
+                    keep[never] = False
+                    # or if 'old' equals 'new' wherever it occurs
+                    same = ((olds[:, None, :] == news[None, :, :]) | ~occurs[:, None, :]).all(axis=2)
+                    self.total_progs_pruned += int((same & keep).sum())
+                    keep &= ~same
+                # output would be too long
+                if self.max_str_len is not None:
+                    lens = np.char.str_len(strs[a])[None, None, :] - old_lens + new_lens
+                    over = (occurs[:, None, :] & (lens > self.max_str_len)).any(axis=2) & keep
+                    self.total_progs_cut += int(over.sum())
+                    keep &= ~over
+                (b, c) = np.nonzero(keep)
+                if len(b) == 0:
+                    continue
+                idx_blocks.append(np.stack([np.full(len(b), a), b, c], axis=1))
+                out_blocks.append(np.char.replace(strs[a][None, :], olds[b], news[c], 1))
+        
+        # go through concat
+        else:
+            (lefts, rights) = cols
+            keep = np.ones((len(lefts), len(rights)), dtype=bool)
+            if self.prune_noops:
+                # concat with an empty string does nothing
+                left_empty = ~(lefts != '').any(axis=1)
+                right_empty = ~(rights != '').any(axis=1)
+                self.total_progs_pruned += int(left_empty.sum()) * len(rights)
+                keep[left_empty] = False
+                self.total_progs_pruned += int(keep[:, right_empty].sum())
+                keep[:, right_empty] = False
+            # output would be too long
+            if self.max_str_len is not None:
+                lens = np.char.str_len(lefts)[:, None, :] + np.char.str_len(rights)[None, :, :]
+                over = (lens > self.max_str_len).any(axis=2) & keep
+                self.total_progs_cut += int(over.sum())
+                keep &= ~over
+            (a, b) = np.nonzero(keep)
+            if len(a) > 0:
+                idx_blocks.append(np.stack([a, b], axis=1))
+                out_blocks.append(np.char.add(lefts[a], rights[b]))
+        
+        if not idx_blocks:
+            return []
+        idxs = np.concatenate(idx_blocks)
+        outs = np.concatenate([out.astype(object) for out in out_blocks])
+        # solved bitmasks of the whole bucket at once
+        bits = np.array([1 << idx for idx in range(len(self.in_out))], dtype=object)
+        solved = (outs == np.array(self.correct_tuple, dtype=object)[None, :]).astype(object).dot(bits)
+        return [(tuple(idx), tuple(out), mask)
+                for (idx, out, mask) in zip(idxs.tolist(), outs.tolist(), solved.tolist())]
+    
+    def build_program(self, sizes, idx):
+        if len(sizes) == 3:
+            return Replace(self.plist[sizes[0]][idx[0]], self.plist[sizes[1]][idx[1]], self.plist[sizes[2]][idx[2]])
+        return Concat(self.plist[sizes[0]][idx[0]], self.plist[sizes[1]][idx[1]])
+    
+    def expand_bucket(self, sizes):
+        '''
+        Worker side of 'parallel_search_level'.
+
+        Parameters
+        ----------
+        sizes : tuple of integers
+            argument costs from 'cost_buckets'.
+
+        Returns
+        -------
+        list of (tuple of integers, tuple of strings)
+            argument indices and outputs of the programs in the bucket whose
+            outputs were not seen before, in enumeration order.
+        integer
+            programs pruned.
+        integer
+            programs cut by the size limits.
+
+        '''
+        pruned = self.total_progs_pruned
+        cut = self.total_progs_cut
+        results = []
+        seen = set()
+        for (idx, out_tuple) in self.bucket_candidates(sizes):
+            key = self.output_key(out_tuple)
+            # anything equivalent to an earlier program is rejected in the merge anyway
+            seen_key = out_tuple if self.digest_check else key
+            if seen_key in seen or self.has_output(out_tuple, key):
+                continue
+            seen.add(seen_key)
+            results.append((idx, out_tuple))
+        return (results, self.total_progs_pruned - pruned, self.total_progs_cut - cut)
+    
+    # argument indices and outputs of the programs in a bucket
+    def bucket_candidates(self, sizes):
+        if self.columnar:
+            for (idx, out_tuple, _) in self.bucket_outputs(sizes):
+                yield (idx, out_tuple)
+            return
+        for idx in self.bucket_programs(sizes):
+            # outputs straight from the arguments' outputs, no interpreting
+            args = [self.bank_outputs[id(self.plist[size][x])] for (size, x) in zip(sizes, idx)]
+            if len(sizes) == 3:
+                out_tuple = tuple(s.replace(old, new, 1) for (s, old, new) in zip(*args))
+            else:
+                out_tuple = tuple(x + y for (x, y) in zip(*args))
+            yield (idx, out_tuple)
+    
+    def parallel_search_level(self):
+        '''
+        Evaluate the current cost level with a pool of 'n_workers' processes.
+        Each worker gets the program list once when the pool is forked, then
+        expands whole cost buckets. Buckets are merged back in enumeration
+        order, so the result is the same as 'new_programs'.
+
+        Returns
+        -------
+        program OR None
+            program if input-output pairs are solved or PCFG should be updated.
+            None otherwise
+        bool
+            Whether all input-output pairs were solved by the program.
+
+        '''
+        buckets = self.cost_buckets()
+        ctx = multiprocessing.get_context('fork')
+        with ctx.Pool(self.n_workers, initializer=init_worker, initargs=(self,)) as pool:
+            for (sizes, (results, pruned, cut)) in zip(buckets, pool.imap(expand_bucket, buckets)):
+                self.total_progs_pruned += pruned
+                self.total_progs_cut += cut
+                for (idx, out_tuple) in results:
+                    p = self.build_program(sizes, idx)
+                    (prog, soln) = self.evaluate_program(p, outputs=out_tuple)
+                    if prog is not None:
+                        return (prog, soln)
+        return (None, False)
+        
+    def version_space_search(self):
+        '''
+        Top-down search. Builds the version space of each input-output pair,
+        intersects them starting from the tuple of outputs and returns the
+        cheapest program under the current grammar costs. The intersection
+        only follows alternatives whose lower cost bound fits a cost bound,
+        which is raised until a program fits under it.
+
+        Returns
+        -------
+        program OR None
+            cheapest program solving all input-output pairs. None if there is
+            none in the version space, none costing at most 'bound' or the
+            version space grows past 'vs_max_nodes'.
+
+        '''
+        terminals = {key: value for key,value in self.grammar.items() if isinstance(value, Node)}
+        spaces = [VersionSpace(terminals, io, self.vs_depth) for io in self.in_out]
+        root = self.correct_tuple
+        if any(out not in space.graph for (out, space) in zip(root, spaces)):
+            return None
+        # cheapest cost of each string on its own, a lower bound for the tuples
+        lower = []
+        for space in spaces:
+            best = self.cheapest_programs(space.graph)
+            lower.append({string: cost for string,(cost, _) in best.items()})
         
-        # go through concat_set
-        for (size1,size2) in tqdm(concat_list):
-            for i in self.plist[size1]:
-                for j in self.plist[size2]:
-                    yield Concat(i, j)
-                    yield Concat(j, i)
+        bound = self.lower_bound(lower, root)
+        while bound is not None and bound <= self.bound:
+            # intersection: nodes are tuples of strings, one per input-output pair
+            alternatives = {}
+            budgets = {}
+            # smallest budget excess of the alternatives left out. A program
+            # using one costs at least that much more than 'bound'
+            excess = None
+            stack = [(root, bound)]
+            while stack:
+                (goals, budget) = stack.pop()
+                if budgets.get(goals, -1) >= budget:
+                    continue
+                if goals not in budgets and len(alternatives) >= self.vs_max_nodes:
+                    return None
+                budgets[goals] = budget
+                (alts, children, over) = self.intersect_alternatives(spaces, lower, goals, budget)
+                alternatives[goals] = alts
+                stack += children
+                if over is not None and (excess is None or over - budget < excess):
+                    excess = over - budget
+            self.total_progs_eval += len(alternatives)
+            best = self.cheapest_programs(alternatives, root)
+            if root in best and best[root][0] <= bound:
+                return self.build_version_space_program(root, best)
+            bound = None if excess is None else bound + excess
+        return None
+    
+    def lower_bound(self, lower, goals):
+        return max(cost[goal] for (cost, goal) in zip(lower, goals))
+    
+    def intersect_alternatives(self, spaces, lower, goals, budget):
+        '''
+        Alternatives building a tuple of strings that can cost at most
+        'budget', with the children to explore and their budgets, and the
+        smallest lower bound of the alternatives left out (None if none).
+        '''
+        costs = self.grammar_costs
+        over = []
+        terms = None
+        replaces = None
+        concats = []
+        for (space, cost, goal) in zip(spaces, lower, goals):
+            goal_terms = set()
+            goal_replaces = {}
+            goal_concats = []
+            for alt in space.graph[goal]:
+                if alt[0] == 'term':
+                    goal_terms.add(alt[1])
+                elif alt[0] == 'replace':
+                    goal_replaces.setdefault(alt[2:], []).append(alt[1])
+                elif costs['concat'] + cost[alt[1]] + cost[alt[2]] <= budget:
+                    goal_concats.append(alt[1:])
+                else:
+                    over.append(costs['concat'] + cost[alt[1]] + cost[alt[2]])
+            if terms is None:
+                terms = goal_terms
+                replaces = {key: [strings] for key,strings in goal_replaces.items()}
+            else:
+                terms &= goal_terms
+                replaces = {key: replaces[key] + [goal_replaces[key]] for key in replaces if key in goal_replaces}
+            concats.append(goal_concats)
         
+        alts = []
+        children = []
+        for key in sorted(terms):
+            if costs[key] <= budget:
+                alts.append(('term', key))
+            else:
+                over.append(costs[key])
+        for (old_key, new_key), strings in replaces.items():
+            rest = budget - costs['replace'] - costs[old_key] - costs[new_key]
+            for combo in itertools.product(*strings):
+                if self.lower_bound(lower, combo) <= rest:
+                    alts.append(('replace', combo, old_key, new_key))
+                    children.append((combo, rest))
+                else:
+                    over.append(budget - rest + self.lower_bound(lower, combo))
+        for combo in itertools.product(*concats):
+            left = tuple(c[0] for c in combo)
+            right = tuple(c[1] for c in combo)
+            # concatenating a blank on every pair builds the goal itself
+            if left == goals or right == goals:
+                continue
+            rest = budget - costs['concat']
+            (left_cost, right_cost) = (self.lower_bound(lower, left), self.lower_bound(lower, right))
+            if left_cost + right_cost <= rest:
+                alts.append(('concat', left, right))
+                children += [(left, rest - right_cost), (right, rest - left_cost)]
+            else:
+                over.append(costs['concat'] + left_cost + right_cost)
+        return (alts, children, min(over) if over else None)
+    
+    def cheapest_programs(self, alternatives, root=None):
+        '''
+        Cheapest alternative of every node in a graph of alternatives, found
+        cheapest first (Knuth's algorithm). Stops once 'root' is reached.
+        '''
+        parents = {}
+        waiting = []
+        heap = []
+        for goals, alts in alternatives.items():
+            for alt in alts:
+                children = set(alt[1:2] if alt[0] == 'replace' else alt[1:] if alt[0] == 'concat' else [])
+                waiting.append(len(children))
+                for child in children:
+                    parents.setdefault(child, []).append((goals, alt, len(waiting) - 1))
+                if not children:
+                    heapq.heappush(heap, (self.alternative_cost(alt, {}), len(heap), goals, alt))
+        best = {}
+        pushed = len(heap)
+        while heap and root not in best:
+            (cost, _, goals, alt) = heapq.heappop(heap)
+            if goals in best:
+                continue
+            best[goals] = (cost, alt)
+            for (parent, parent_alt, idx) in parents.get(goals, []):
+                waiting[idx] -= 1
+                if waiting[idx] == 0 and parent not in best:
+                    pushed += 1
+                    heapq.heappush(heap, (self.alternative_cost(parent_alt, best), pushed, parent, parent_alt))
+        return best
+    
+    def alternative_cost(self, alt, best):
+        if alt[0] == 'term':
+            return self.grammar_costs[alt[1]]
+        if alt[0] == 'replace':
+            return self.grammar_costs['replace'] + best[alt[1]][0] + \
+                self.grammar_costs[alt[2]] + self.grammar_costs[alt[3]]
+        return self.grammar_costs['concat'] + best[alt[1]][0] + best[alt[2]][0]
+    
+    def build_version_space_program(self, goals, best):
+        alt = best[goals][1]
+        if alt[0] == 'term':
+            return self.grammar[alt[1]]
+        if alt[0] == 'replace':
+            return Replace(self.build_version_space_program(alt[1], best),
+                           self.grammar[alt[2]], self.grammar[alt[3]])
+        return Concat(self.build_version_space_program(alt[1], best),
+                      self.build_version_space_program(alt[2], best))
+    
     def update_grammar_costs(self):
-        # equal probabilities
-        p_u = 1 / len(self.grammar)
-        # initialize array of probabilities
-        pcfg_probs_array = np.zeros(len(self.grammar))
-        # get 'max' part from paper cost update equation
-        for i,key in enumerate(self.grammar.keys()):
-            if key == '':
-                rule_str = 'BLANK'
+        self.grammar_costs = max_occ_costs(self.max_occ)
+        self.emit('grammar_update', grammar_costs=self.grammar_costs)
+    
+    # count a program solving 'solved' input-output pairs in the rule maxima
+    def add_solved(self, p, solved):
+        update_max_occ(self.max_occ, {'program': p.toString(), 'solved': solved, 'examples': len(self.in_out)})
+    
+    # partial solutions of this run in 'save_pcfg' form. The solution is
+    # left out: it uses every rule it needs, so it would give them all the
+    # same cost
+    def solved_programs(self):
+        solved = []
+        for (mask, p) in self.partial_solutions.items():
+            solved.append({'program': p.toString(), 'solved': bin(mask).count('1'), 'examples': len(self.in_out)})
+        return solved
+    
+    def save_pcfg(self, path):
+        '''
+        Save the partial solutions of this run and those loaded from earlier
+        runs, with the grammar costs learned from them. 'combine_pcfg'
+        computes costs from the partial solutions the same way.
+
+        Parameters
+        ----------
+        path : string
+            JSON file to write.
+
+        '''
+        solved = self.learned_solutions + self.solved_programs()
+        write_pcfg(path, list(self.grammar.keys()), solved)
+    
+    def load_pcfg(self, path):
+        '''
+        Start from grammar costs saved by 'save_pcfg' or 'combine_pcfg'. The
+        saved partial solutions are kept and count in later cost updates.
+
+        Parameters
+        ----------
+        path : string
+            JSON file to read.
+
+        '''
+        with open(path) as f:
+            learned = json.load(f)
+        for key in self.grammar.keys():
+            if key in learned['grammar_costs']:
+                self.grammar_costs[key] = learned['grammar_costs'][key]
+        self.learned_solutions = learned['partial_solutions']
+        for ps in self.learned_solutions:
+            update_max_occ(self.max_occ, ps)
+
+
+# many guided bottom-up searches sharing one grammar
+class BatchGBUS:
+    '''
+    Batch of GBUS tasks under one grammar. Partial solutions of every task
+    feed one shared cost update, and tasks take turns one cost level at a
+    time, lowest cost level first.
+    '''
+    def __init__(self, grammar, tasks, bound, pcfg_start='equal', pcfg_file=None, events=None, **kwargs):
+        '''
+
+        Parameters
+        ----------
+        grammar : dict
+            grammar shared by all tasks.
+        tasks : list of lists of dicts
+            input-output pairs of each task.
+        bound : integer
+            maximum cost of a program in any task.
+        pcfg_start : string (either 'equal' or 'learned')
+            starting grammar costs, as in GBUS.
+        pcfg_file : string OR None
+            JSON file to start from if pcfg_start is 'learned'.
+        events : 'EventSink' OR None
+            receives the events of all tasks, each with its 'task' index.
+            None for an 'EventSink', which does no I/O
+        **kwargs
+            other GBUS options, used by every task. Only bottom-up search
+            can be interleaved.
+
+        '''
+        assert pcfg_start in ['equal', 'learned']
+        assert kwargs.get('search', 'bottom_up') == 'bottom_up'
+        self.grammar = grammar
+        self.events = EventSink() if events is None else events
+        self.searches = [GBUS(grammar=grammar, in_out=in_out, bound=bound, pcfg_start=pcfg_start,
+                              update_pcfg=True, pcfg_file=pcfg_file, events=self.events, **kwargs)
+                         for in_out in tasks]
+        for idx, search in enumerate(self.searches):
+            search.event_fields = {'task': idx}
+    
+    def run(self):
+        '''
+        Search all tasks, yielding each one as soon as it finishes.
+
+        Yields
+        ------
+        integer
+            index of the task.
+        program OR None
+            solution of the task. None if its bound was reached.
+
+        '''
+        for search in self.searches:
+            search.true_init()
+        self.grammar_costs = dict(self.searches[0].grammar_costs)
+        self.learned_solutions = self.searches[0].learned_solutions
+        self.results = [None] * len(self.searches)
+        # grammar costs each task's program list was built with
+        started = [None] * len(self.searches)
+        queue = [(0, idx) for idx in range(len(self.searches))]
+        while queue:
+            (_, idx) = heapq.heappop(queue)
+            search = self.searches[idx]
+            # restart with the shared costs whenever they changed
+            if started[idx] != self.grammar_costs:
+                search.grammar_costs = dict(self.grammar_costs)
+                started[idx] = search.grammar_costs
+                (prog, soln) = search.start_search()
             else:
-                rule_str = key
-            max_occ = 0
-            for (p, sst) in self.partial_solutions:
-                if rule_str in p.toString():
-                    if sum(sst) > max_occ:
-                        max_occ = sum(sst)
-            pcfg_probs_array[i] = p_u**(1 - (max_occ / len(self.in_out)))
-        # normalize probabilities to sum to 1
-        pcfg_probs_array = pcfg_probs_array / np.sum(pcfg_probs_array)
-        # update grammar costs
-        for i,key in enumerate(self.grammar.keys()):
-            self.grammar_costs[key] = round(-math.log2(pcfg_probs_array[i]))
-        print(self.grammar_costs)
+                (prog, soln) = search.search_level()
+            if soln is None:
+                search.found_solution(None)
+                yield (idx, None)
+                continue
+            if soln == True:
+                search.found_solution(prog)
+                self.results[idx] = prog
+                yield (idx, prog)
+                continue
+            if prog is not None:
+                # the rest of this level wasn't searched, so restart either way
+                started[idx] = None
+                self.update_grammar_costs()
+            heapq.heappush(queue, (search.current_cost, idx))
+    
+    # partial solutions of all tasks, including those loaded from earlier runs
+    def solved_programs(self):
+        solved = list(self.learned_solutions)
+        for search in self.searches:
+            solved += search.solved_programs()
+        return solved
+    
+    def update_grammar_costs(self):
+        # every task already counts the partial solutions loaded from a file
+        max_occ = {key: max(search.max_occ[key] for search in self.searches) for key in self.grammar.keys()}
+        self.grammar_costs = max_occ_costs(max_occ)
+        self.events.emit('grammar_update', grammar_costs=self.grammar_costs)
+    
+    def save_pcfg(self, path):
+        '''
+        Save the partial solutions of all tasks with the grammar costs
+        learned from them, in the same form as 'GBUS.save_pcfg'.
+
+        Parameters
+        ----------
+        path : string
+            JSON file to write.
+
+        '''
+        solved = self.solved_programs()
+        write_pcfg(path, list(self.grammar.keys()), solved)
+
+
+# PCFG costs from partial solutions
+def pcfg_costs(rules, solved):
+    '''
+
+    Parameters
+    ----------
+    rules : list of strings
+        keys of the grammar.
+    solved : list of dicts
+        partial solutions with the program string, the number of input-output
+        pairs solved and the number of input-output pairs in their task.
+
+    Returns
+    -------
+    dict
+        cost of each rule.
+
+    '''
+    max_occ = dict.fromkeys(rules, 0)
+    for ps in solved:
+        update_max_occ(max_occ, ps)
+    return max_occ_costs(max_occ)
+
+# save partial solutions with the grammar costs learned from them
+def write_pcfg(path, rules, solved):
+    '''
+
+    Parameters
+    ----------
+    path : string
+        JSON file to write.
+    rules : list of strings
+        keys of the grammar.
+    solved : list of dicts
+        partial solutions, as in 'pcfg_costs'.
+
+    '''
+    with open(path, 'w') as f:
+        json.dump({'grammar_costs': pcfg_costs(rules, solved),
+                   'partial_solutions': solved},
+                  f, indent=1)
+
+# add a partial solution to the running 'max' part of the cost update
+def update_max_occ(max_occ, ps):
+    '''
+
+    Parameters
+    ----------
+    max_occ : dict
+        largest fraction of input-output pairs solved by a partial solution
+        using each rule. Updated in place.
+    ps : dict
+        partial solution with the program string, the number of input-output
+        pairs solved and the number of input-output pairs in its task.
+
+    '''
+    for key in max_occ.keys():
+        if key == '':
+            rule_str = 'BLANK'
+        else:
+            rule_str = key
+        if rule_str in ps['program']:
+            if ps['solved'] / ps['examples'] > max_occ[key]:
+                max_occ[key] = ps['solved'] / ps['examples']
+
+# PCFG costs from the 'max' part of the cost update of each rule
+def max_occ_costs(max_occ):
+    rules = list(max_occ.keys())
+    # equal probabilities
+    p_u = 1 / len(rules)
+    # initialize array of probabilities
+    pcfg_probs_array = np.zeros(len(rules))
+    for i,key in enumerate(rules):
+        pcfg_probs_array[i] = p_u**(1 - max_occ[key])
+    # normalize probabilities to sum to 1
+    pcfg_probs_array = pcfg_probs_array / np.sum(pcfg_probs_array)
+    # grammar costs
+    grammar_costs = {}
+    for i,key in enumerate(rules):
+        grammar_costs[key] = round(-math.log2(pcfg_probs_array[i]))
+    return grammar_costs
+
+# combine learned PCFGs of many tasks
+def combine_pcfg(paths, out_path):
+    '''
+    Pool the partial solutions of files saved by 'GBUS.save_pcfg' and write
+    the grammar costs learned from all of them.
+
+    Parameters
+    ----------
+    paths : list of strings
+        JSON files to combine.
+    out_path : string
+        JSON file to write.
+
+    '''
+    rules = []
+    solved = []
+    for path in paths:
+        with open(path) as f:
+            learned = json.load(f)
+        for key in learned['grammar_costs'].keys():
+            if key not in rules:
+                rules.append(key)
+        solved += learned['partial_solutions']
+    write_pcfg(out_path, rules, solved)
+
+
+# search shared with pool workers, set once per cost level
+worker_search = None
+
+def init_worker(search):
+    global worker_search
+    worker_search = search
+
+def expand_bucket(sizes):
+    return worker_search.expand_bucket(sizes)
 
 
 # input-output pairs
@@ -328,20 +1337,23 @@ grammar = {
     }
 
 # RUN
-start_time = time.time()
-synthesizer = GBUS(grammar=grammar, in_out=in_out, bound=100,
-                   pcfg_start='equal', update_pcfg=True)
-p = synthesizer.run_search()
-print('\nSolution:')
-print(p.toString())
-print('\nTime:')
-print(time.time() - start_time)
-print('\nNumber of programs:')
-
-num_progs = 0
-for cost, cost_plist in synthesizer.plist.items():
-    print(f'Cost {cost}: {len(cost_plist)}')
-    num_progs += len(cost_plist)
-
-print(f'Total: {num_progs}')
-print(f'True total: {synthesizer.total_progs_eval}')
+if __name__ == '__main__':
+    start_time = time.time()
+    synthesizer = GBUS(grammar=grammar, in_out=in_out, bound=100,
+                       pcfg_start='equal', update_pcfg=True, events=PrintSink())
+    p = synthesizer.run_search()
+    print('\nSolution:')
+    print(p.toString())
+    print('\nTime:')
+    print(time.time() - start_time)
+    print('\nNumber of programs:')
+
+    num_progs = 0
+    for cost, cost_plist in synthesizer.plist.items():
+        print(f'Cost {cost}: {len(cost_plist)}')
+        num_progs += len(cost_plist)
+
+    print(f'Total: {num_progs}')
+    print(f'True total: {synthesizer.total_progs_eval}')
+    print(f'Pruned: {synthesizer.total_progs_pruned}')
+    print(f'Cut by size limits: {synthesizer.total_progs_cut}')
@@ -0,0 +1,147 @@
+import argparse, json, multiprocessing, os, platform, resource, subprocess, time
+from JCostello_Assignment2 import GBUS, EventSink, grammar
+
+# bundled string-transformation tasks
+TASKS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'tasks.json')
+
+# (pcfg_start, update_pcfg) of each configuration
+CONFIGS = [('equal', True), ('equal', False), ('final', True), ('final', False)]
+
+
+# event sink counting grammar updates
+class CountingSink(EventSink):
+    def __init__(self):
+        self.grammar_updates = 0
+
+    def emit(self, event, **fields):
+        if event == 'grammar_update':
+            self.grammar_updates += 1
+
+
+def run_task(task, pcfg_start, update_pcfg, options, queue):
+    '''
+    Run one task in one configuration and put its measurements on 'queue'.
+    Meant to run in a fresh process so the peak memory is its own.
+    '''
+    events = CountingSink()
+    synthesizer = GBUS(grammar=grammar, in_out=task['in_out'], bound=task['bound'],
+                       pcfg_start=pcfg_start, update_pcfg=update_pcfg, events=events, **options)
+    start_time = time.time()
+    p = synthesizer.run_search()
+    seconds = time.time() - start_time
+    queue.put({'solved': p is not None,
+               'program': None if p is None else p.toString(),
+               'seconds': seconds,
+               'evaluated': synthesizer.total_progs_eval,
+               'pruned': synthesizer.total_progs_pruned,
+               'cut': synthesizer.total_progs_cut,
+               'grammar_updates': events.grammar_updates,
+               # kilobytes on Linux
+               'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss})
+
+
+def run_benchmark(tasks, timeout, options, names=None):
+    '''
+
+    Parameters
+    ----------
+    tasks : list of dicts
+        tasks with their name, difficulty, bound and input-output pairs.
+    timeout : float
+        seconds allowed for each run.
+    options : dict
+        other GBUS options, used by every run.
+    names : list of strings OR None
+        names of the tasks to run. None for all
+
+    Returns
+    -------
+    list of dicts
+        measurements of every task in every configuration. Runs that time
+        out or crash have 'status' set and no measurements.
+
+    '''
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for task in tasks:
+        if names is not None and task['name'] not in names:
+            continue
+        for (pcfg_start, update_pcfg) in CONFIGS:
+            row = {'task': task['name'], 'difficulty': task['difficulty'],
+                   'pcfg_start': pcfg_start, 'update_pcfg': update_pcfg}
+            queue = ctx.Queue()
+            proc = ctx.Process(target=run_task, args=(task, pcfg_start, update_pcfg, options, queue))
+            proc.start()
+            proc.join(timeout)
+            if proc.is_alive():
+                proc.terminate()
+                proc.join()
+                row['status'] = 'timeout'
+            elif queue.empty():
+                # killed, e.g. out of memory
+                row['status'] = f'exit {proc.exitcode}'
+            else:
+                row['status'] = 'ok'
+                row.update(queue.get())
+            print(f"{row['task']:<22} {pcfg_start:<6} update={str(update_pcfg):<5} {row['status']:<8}"
+                  + (f" {row['seconds']:8.3f}s {row['evaluated']:>9} progs" if row['status'] == 'ok' else ''))
+            results.append(row)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(old_path, new_path):
+    '''
+    Print the time and program count of each run in 'new_path' against the
+    same task and configuration in 'old_path'.
+    '''
+    with open(old_path) as f:
+        old = {(r['task'], r['pcfg_start'], r['update_pcfg']): r for r in json.load(f)['results']}
+    with open(new_path) as f:
+        new = json.load(f)['results']
+    for r in new:
+        key = (r['task'], r['pcfg_start'], r['update_pcfg'])
+        label = f'{key[0]:<22} {key[1]:<6} update={str(key[2]):<5}'
+        if key not in old:
+            print(f'{label} not in {old_path}')
+        elif r['status'] != 'ok' or old[key]['status'] != 'ok':
+            print(f"{label} {old[key]['status']} -> {r['status']}")
+        else:
+            o = old[key]
+            ratio = r['seconds'] / o['seconds'] if o['seconds'] > 0 else float('inf')
+            print(f"{label} {o['seconds']:8.3f}s -> {r['seconds']:8.3f}s ({ratio:5.2f}x)"
+                  f"  progs {o['evaluated']} -> {r['evaluated']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark GBUS on the bundled string tasks.')
+    parser.add_argument('--tasks', default=TASKS_FILE, help='JSON file of tasks')
+    parser.add_argument('--only', nargs='+', help='names of the tasks to run')
+    parser.add_argument('--timeout', type=float, default=120, help='seconds allowed for each run')
+    parser.add_argument('--columnar', action='store_true', help='use columnar bucket evaluation')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON file to write')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    with open(args.tasks) as f:
+        tasks = json.load(f)
+    options = {'columnar': args.columnar}
+    results = run_benchmark(tasks, args.timeout, options, args.only)
+    with open(args.output, 'w') as f:
+        json.dump({'commit': git_commit(),
+                   'python': platform.python_version(),
+                   'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'timeout': args.timeout,
+                   'options': options,
+                   'results': results},
+                  f, indent=1)
+    if args.compare is not None:
+        print()
+        compare(args.compare, args.output)
@@ -0,0 +1,62 @@
+from JCostello_Assignment2 import GBUS, BatchGBUS, Var, Str, Concat, Replace, grammar
+
+# specs on which the version space cost bound used to go back and forth
+VERSION_SPACE_SPECS = [[{'arg': '<ab>', 'out': 'ab'}, {'arg': '<<c', 'out': 'c'}],
+                       [{'arg': 'bb', 'out': 'bb'}, {'arg': '<<<', 'out': '<'}],
+                       [{'arg': '>a<c', 'out': '>'}, {'arg': 'cbc', 'out': 'cbc'}],
+                       [{'arg': '<>', 'out': '>'}, {'arg': ' b', 'out': ' b'}]]
+
+
+# cost of a program under the grammar costs of a search
+def program_cost(p, costs):
+    if isinstance(p, Concat):
+        return costs['concat'] + program_cost(p.x, costs) + program_cost(p.y, costs)
+    if isinstance(p, Replace):
+        return costs['replace'] + program_cost(p.str, costs) + \
+            program_cost(p.old, costs) + program_cost(p.new, costs)
+    if isinstance(p, Var):
+        return costs['arg']
+    return costs[p.value]
+
+
+# whether every 'replace' of a program has terminals as 'old' and 'new'
+def terminal_replaces(p):
+    if isinstance(p, Concat):
+        return terminal_replaces(p.x) and terminal_replaces(p.y)
+    if isinstance(p, Replace):
+        return isinstance(p.old, (Var, Str)) and isinstance(p.new, (Var, Str)) and terminal_replaces(p.str)
+    return True
+
+
+def test_version_space_finds_cheapest():
+    for in_out in VERSION_SPACE_SPECS:
+        top_down = GBUS(grammar, in_out, 60, update_pcfg=False, search='version_space')
+        p = top_down.run_search()
+        assert p is not None and top_down.solves(p)
+        bottom_up = GBUS(grammar, in_out, 60, update_pcfg=False)
+        q = bottom_up.run_search()
+        # bottom-up search returns the cheapest program of the whole grammar,
+        # the version space the cheapest one with terminal 'replace' arguments
+        if q is not None and terminal_replaces(q):
+            assert program_cost(p, top_down.grammar_costs) == program_cost(q, bottom_up.grammar_costs)
+
+
+def test_version_space_bound():
+    in_out = VERSION_SPACE_SPECS[0]
+    synthesizer = GBUS(grammar, in_out, 60, update_pcfg=False, search='version_space')
+    cost = program_cost(synthesizer.run_search(), synthesizer.grammar_costs)
+    assert GBUS(grammar, in_out, cost, update_pcfg=False, search='version_space').run_search() is not None
+    assert GBUS(grammar, in_out, cost - 1, update_pcfg=False, search='version_space').run_search() is None
+
+
+def test_batch_solutions_solve_their_task():
+    # tasks with different numbers of examples, sharing the grammar's nodes
+    tasks = [[{'arg': 'x', 'out': 'x<'}, {'arg': 'y', 'out': 'y<'}],
+             [{'arg': 'p', 'out': 'p<'}, {'arg': 'q', 'out': 'q<'}, {'arg': 'r', 'out': 'r<'}],
+             [{'arg': 'a<b', 'out': 'ab'}, {'arg': '<c<', 'out': 'c<'}],
+             [{'arg': '<a>', 'out': 'a'}]]
+    for columnar in [False, True]:
+        synthesizer = BatchGBUS(grammar, tasks, 60, columnar=columnar)
+        results = dict(synthesizer.run())
+        for (idx, search) in enumerate(synthesizer.searches):
+            assert results[idx] is not None and search.solves(results[idx])
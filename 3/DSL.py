@@ -1,6 +1,187 @@
 import numpy as np
 import itertools
 
+# element types summed and compared by plain Python in compiled programs
+NUMBER_TYPES = (int, bool, np.int64)
+
+def compile_program(program):
+    """
+    Compile 'program' into a Python function of env returning what
+    program.interpret(env) returns. The lambda variables are kept in one
+    dict per call, read and written as interpret_local_variables does with
+    env['locals'].
+    """
+
+    function = program.compile()
+
+    def run(env):
+        return function(env, {})
+    return run
+
+def set_local_variable(local, x, intname, listname):
+    """ Store lambda argument 'x' as interpret_local_variables does. """
+
+    # only the int and list variables are ever read
+    if type(x) is int:
+        local[intname] = x
+    elif type(x) is tuple:
+        local[listname] = list(x)
+    elif type(x) is list:
+        local[listname] = x
+
+def fast_sum(values):
+    """ np.sum(values), without building an array for a list of integers. """
+
+    if values and all(type(v) in NUMBER_TYPES for v in values):
+        return np.int64(sum(values))
+    return np.sum(values)
+
+def fast_argmax(values):
+    """ np.argmax(values), without building an array for a list of integers. """
+
+    if values and all(type(v) in NUMBER_TYPES for v in values):
+        return np.intp(max(range(len(values)), key=values.__getitem__))
+    return np.argmax(values)
+
+# Batch interpretation. Exceptions interpret would raise are recorded per
+# state as bits; FALLBACK marks states the batch interpreter can't answer.
+ERROR_BITS = {KeyError: 1, AttributeError: 2, IndexError: 4, ValueError: 8}
+FALLBACK = 16
+# lambda variable overwritten by an inner Map: its value depends on the
+# last element mapped, which batch interpretation doesn't track
+STALE = 'stale'
+
+def interpret_batch(program, env, n_states):
+    """
+    Interpret 'program' over a batch of n_states states at once. env is
+    the batch counterpart of the interpret env: lists are BatchValue,
+    'state' answers number_advanced_this_round and is_new_neutral for
+    arrays of columns, the other names are as in interpret.
+    Return the (n_states,) values, and per state the exception type
+    interpret raises (None if it returns), or FALLBACK if the value must
+    be computed with interpret.
+    Raise NotImplementedError for programs outside the supported subset
+    (lists in arithmetic, nested Argmax, lambda variables read after an
+    inner Map rebinds them...).
+    """
+
+    context = BatchContext(n_states)
+    value = program.interpret_batch(env, context, {})
+    if value.kind == 'list':
+        raise NotImplementedError('list result')
+    data = np.broadcast_to(value.data, (n_states,))
+    outcomes = []
+    for bits in context.errors.tolist():
+        if bits == 0:
+            outcomes.append(None)
+        elif bits & FALLBACK or bits & (bits - 1):
+            # several exception types: which comes first depends on order
+            outcomes.append(FALLBACK)
+        else:
+            outcomes.append(next(error for (error, bit) in ERROR_BITS.items() if bit == bits))
+    return data, outcomes
+
+class BatchValue:
+    def __init__(self, data, ndim, kind, masks=(), elem=None):
+        """
+        Value of a DSL expression over a batch of states.
+        - data has ndim context axes (the batch axis, then one per enclosing
+          Map, any of them possibly of size 1), then one axis per list level.
+        - kind is 'int' (Python int), 'bool', 'np' (numpy scalar), 'str' or
+          'list'.
+        - masks holds, per list level, which entries exist. Entries of a list
+          are a prefix of its axis.
+        - elem is the kind of the innermost elements of a list.
+        """
+
+        self.data = data
+        self.ndim = ndim
+        self.kind = kind
+        self.masks = list(masks)
+        self.elem = elem
+
+    def align(self, ndim):
+        """ Return this value with size-1 context axes added up to ndim. """
+
+        if ndim == self.ndim:
+            return self
+        index = (slice(None),) * self.ndim + (None,) * (ndim - self.ndim)
+        return BatchValue(self.data[index], ndim, self.kind,
+                          [mask[index] for mask in self.masks], self.elem)
+
+class BatchContext:
+    def __init__(self, n_states, ndim=1, mask=None, errors=None, raised=None):
+        """
+        Where an expression is evaluated: ndim context axes and the mask of
+        the entries that exist (the elements of the enclosing Maps).
+        errors holds the exception bits of each state and raised the states
+        whose exception is known to be the first raised, both shared by all
+        the contexts of one interpretation.
+        """
+
+        self.n_states = n_states
+        self.ndim = ndim
+        self.mask = np.ones(n_states, dtype=bool) if mask is None else mask
+        self.errors = np.zeros(n_states, dtype=np.int64) if errors is None else errors
+        self.raised = np.zeros(n_states, dtype=bool) if raised is None else raised
+
+    def fail(self, bits, where=True):
+        """ Record 'bits' for the states where 'where' holds in an entry. """
+
+        if self.ndim == 1:
+            # outside of Maps, the states are evaluated in interpret's order
+            self.raised |= self.errors != 0
+        reached = np.broadcast_to(np.logical_and(where, self.mask), self.mask.shape)
+        reached = reached.reshape(reached.shape[0], -1).any(axis=1)
+        reached = np.broadcast_to(reached, (self.n_states,)) & ~self.raised
+        self.errors |= np.where(reached, bits, 0)
+        if self.ndim == 1:
+            self.raised |= reached
+
+    def inner(self, mask):
+        """ Return the context of the elements of a list with entries 'mask'. """
+
+        return BatchContext(self.n_states, self.ndim + 1,
+                            np.logical_and(self.mask[..., None], mask), self.errors, self.raised)
+
+def read_local(local, name, context):
+    """
+    Return the lambda variable 'name' as interpret would read it, or None
+    if it isn't bound, where interpret raises KeyError.
+    """
+
+    if name not in local:
+        # env['locals'] has no such key yet
+        context.fail(ERROR_BITS[KeyError])
+        return None
+    if local[name] is STALE:
+        raise NotImplementedError('lambda variable rebound by an inner map')
+    return local[name].align(context.ndim)
+
+def scalar_value(value, kind, context):
+    """ BatchValue of the same scalar in every entry. """
+
+    return BatchValue(np.full((1,) * context.ndim, value, dtype=np.int64), context.ndim, kind)
+
+def constant_value(value, context):
+    """ BatchValue of an integer of env. """
+
+    if type(value) is not int:
+        raise NotImplementedError('non-integer constant')
+    return scalar_value(value, 'int', context)
+
+def arithmetic(left, right, context, operation):
+    """ Apply 'operation' to two scalar BatchValues. """
+
+    if left.kind not in ('int', 'bool', 'np') or right.kind not in ('int', 'bool', 'np'):
+        raise NotImplementedError('arithmetic on lists')
+    left = left.align(context.ndim)
+    right = right.align(context.ndim)
+    # bool operands are Python bools, which add and subtract as integers
+    data = operation(left.data.astype(np.int64), right.data.astype(np.int64))
+    kind = 'np' if 'np' in (left.kind, right.kind) else 'int'
+    return BatchValue(data, context.ndim, kind)
+
 class Node:
     def __init__(self):
         self.size = 0
@@ -19,6 +200,20 @@ class Node:
     def interpret(self):
         raise Exception('Unimplemented method: interpret')
     
+    def compile(self):
+        """
+        Return a function of (env, local) computing interpret(env), where
+        local holds the lambda variables.
+        """
+        raise Exception('Unimplemented method: compile')
+    
+    def interpret_batch(self, env, context, local):
+        """
+        Return the BatchValue of this node over a batch of states, local
+        holding the lambda variables as BatchValue (see interpret_batch).
+        """
+        raise NotImplementedError('Unimplemented method: interpret_batch')
+    
     def interpret_local_variables(self, env, x):        
         if self.local not in env:
             env[self.local] = {}
@@ -52,6 +247,13 @@ class VarList(Node):
     def interpret(self, env):
         return env[self.name]
     
+    def compile(self):
+        name = self.name
+        return lambda env, local: env[name]
+    
+    def interpret_batch(self, env, context, local):
+        return env[self.name].align(context.ndim)
+    
 class VarScalarFromArray(Node):
     def __init__(self, name):
         super(VarScalarFromArray, self).__init__()
@@ -65,6 +267,23 @@ class VarScalarFromArray(Node):
         # NOT WORKING???
         return env[self.name][env[self.local][self.intname]]
     
+    def compile(self):
+        name = self.name
+        intname = self.intname
+        return lambda env, local: env[name][local[intname]]
+    
+    def interpret_batch(self, env, context, local):
+        index = read_local(local, self.intname, context)
+        if index is None:
+            return scalar_value(0, 'int', context)
+        if index.kind != 'int':
+            raise NotImplementedError('index of kind ' + index.kind)
+        table = np.array(env[self.name], dtype=np.int64)
+        n = len(table)
+        # Python list indexing: negative indexes count from the end
+        context.fail(ERROR_BITS[IndexError], (index.data < -n) | (index.data >= n))
+        return BatchValue(table[np.clip(index.data, -n, n - 1)], context.ndim, 'int')
+    
 class VarScalar(Node):
     def __init__(self, name):
         self.name = name
@@ -76,6 +295,13 @@ class VarScalar(Node):
     def interpret(self, env):
         return env[self.name]
     
+    def compile(self):
+        name = self.name
+        return lambda env, local: env[name]
+    
+    def interpret_batch(self, env, context, local):
+        return constant_value(env[self.name], context)
+    
 class Constant(Node):
     def __init__(self, value):
         self.value = value
@@ -86,6 +312,13 @@ class Constant(Node):
     
     def interpret(self, env):
         return self.value
+    
+    def compile(self):
+        value = self.value
+        return lambda env, local: value
+    
+    def interpret_batch(self, env, context, local):
+        return constant_value(self.value, context)
 
 class NumberAdvancedByAction(Node):
     def __init__(self):
@@ -100,14 +333,33 @@ class NumberAdvancedByAction(Node):
         Return the number of positions advanced in this round for a given
         column by the player.
         """
-        action = env[self.local][self.listname]
-        
+        return self.advanced(env[self.local][self.listname])
+    
+    def advanced(self, action):
         # Special case: doubled action (e.g. (6,6))
         if len(action) == 2 and action[0] == action[1]:
             return 2
         # All other cases will advance only one cell per column
         else:
             return 1
+    
+    def compile(self):
+        advanced = self.advanced
+        listname = self.listname
+        return lambda env, local: advanced(local[listname])
+    
+    def interpret_batch(self, env, context, local):
+        action = read_local(local, self.listname, context)
+        if action is None:
+            return scalar_value(1, 'int', context)
+        if action.kind != 'list' or len(action.masks) != 1:
+            raise NotImplementedError('action of nested lists')
+        length = action.masks[0].sum(axis=-1)
+        if action.data.shape[-1] >= 2:
+            double = (length == 2) & (action.data[..., 0] == action.data[..., 1])
+        else:
+            double = np.zeros(length.shape, dtype=bool)
+        return BatchValue(np.where(double, 2, 1), context.ndim, 'int')
 
 class IsNewNeutral(Node):
     def __init__(self):
@@ -122,16 +374,24 @@ class IsNewNeutral(Node):
         Return the number of positions advanced in this round for a given
         column by the player.
         """
-        state = env[self.statename]
-        column = env[self.local][self.intname]
-        
+        return self.is_new_neutral(env[self.statename], env[self.local][self.intname])
+    
+    def is_new_neutral(self, state, column):
         # Return a boolean representing if action will place a new neutral. """
-        is_new_neutral = True
-        for neutral in state.neutral_positions:
-            if neutral[0] == column:
-                is_new_neutral = False
-
-        return is_new_neutral
+        return state.is_new_neutral(column)
+    
+    def compile(self):
+        statename = self.statename
+        intname = self.intname
+        return lambda env, local: env[statename].is_new_neutral(local[intname])
+    
+    def interpret_batch(self, env, context, local):
+        column = read_local(local, self.intname, context)
+        if column is None:
+            return scalar_value(True, 'bool', context)
+        if column.kind != 'int':
+            raise NotImplementedError('column of kind ' + column.kind)
+        return BatchValue(env[self.statename].is_new_neutral(column.data), context.ndim, 'bool')
 
 
 class NumberAdvancedThisRound(Node):
@@ -147,34 +407,26 @@ class NumberAdvancedThisRound(Node):
         Return the number of positions advanced in this round for a given
         column by the player.
         """
-        state = env[self.statename]
-        column = env[self.local][self.intname]
-        
-        counter = 0
-        previously_conquered = -1
-        neutral_position = -1
-        list_of_cells = state.board_game.board[column]
-
-        for i in range(len(list_of_cells)):
-            if state.player_turn in list_of_cells[i].markers:
-                previously_conquered = i
-            if 0 in list_of_cells[i].markers:
-                neutral_position = i
-        if previously_conquered == -1 and neutral_position != -1:
-            counter += neutral_position + 1
-            for won_column in state.player_won_column:
-                if won_column[0] == column:
-                    counter += 1
-        elif previously_conquered != -1 and neutral_position != -1:
-            counter += neutral_position - previously_conquered
-            for won_column in state.player_won_column:
-                if won_column[0] == column:
-                    counter += 1
-        elif previously_conquered != -1 and neutral_position == -1:
-            for won_column in state.player_won_column:
-                if won_column[0] == column:
-                    counter += len(list_of_cells) - previously_conquered
-        return counter
+        return self.advanced(env[self.statename], env[self.local][self.intname])
+    
+    def advanced(self, state, column):
+        return state.number_advanced_this_round(column)
+    
+    def compile(self):
+        statename = self.statename
+        intname = self.intname
+        return lambda env, local: env[statename].number_advanced_this_round(local[intname])
+    
+    def interpret_batch(self, env, context, local):
+        column = read_local(local, self.intname, context)
+        if column is None:
+            return scalar_value(0, 'int', context)
+        if column.kind != 'int':
+            raise NotImplementedError('column of kind ' + column.kind)
+        advanced, outside = env[self.statename].number_advanced_this_round(column.data)
+        # columns off the board wrap around or raise, as list indexes do
+        context.fail(FALLBACK, outside)
+        return BatchValue(advanced, context.ndim, 'int')
 
 class Times(Node):
     def __init__(self, left, right):
@@ -188,6 +440,16 @@ class Times(Node):
     
     def interpret(self, env):
         return self.left.interpret(env) * self.right.interpret(env)
+    
+    def compile(self):
+        left = self.left.compile()
+        right = self.right.compile()
+        return lambda env, local: left(env, local) * right(env, local)
+    
+    def interpret_batch(self, env, context, local):
+        left = self.left.interpret_batch(env, context, local)
+        right = self.right.interpret_batch(env, context, local)
+        return arithmetic(left, right, context, np.multiply)
 
 class Minus(Node):
     def __init__(self, left, right):
@@ -202,6 +464,16 @@ class Minus(Node):
     def interpret(self, env):
         return self.left.interpret(env) - self.right.interpret(env)
     
+    def compile(self):
+        left = self.left.compile()
+        right = self.right.compile()
+        return lambda env, local: left(env, local) - right(env, local)
+    
+    def interpret_batch(self, env, context, local):
+        left = self.left.interpret_batch(env, context, local)
+        right = self.right.interpret_batch(env, context, local)
+        return arithmetic(left, right, context, np.subtract)
+    
 
 class Plus(Node):
     def __init__(self, left, right):
@@ -216,6 +488,16 @@ class Plus(Node):
     def interpret(self, env):
         return self.left.interpret(env) + self.right.interpret(env)
     
+    def compile(self):
+        left = self.left.compile()
+        right = self.right.compile()
+        return lambda env, local: left(env, local) + right(env, local)
+    
+    def interpret_batch(self, env, context, local):
+        left = self.left.interpret_batch(env, context, local)
+        right = self.right.interpret_batch(env, context, local)
+        return arithmetic(left, right, context, np.add)
+    
 
 class Function(Node):
     def __init__(self, expression):
@@ -227,7 +509,23 @@ class Function(Node):
         return "(lambda x : " + self.expression.toString() + ")"
     
     def interpret(self, env):
-        return lambda x : self.expression.interpret_local_variables(env, x)   
+        return lambda x : self.expression.interpret_local_variables(env, x)
+    
+    def compile(self):
+        # interpret_local_variables fails on nodes built without
+        # Node.__init__, keep that behaviour
+        if not hasattr(self.expression, 'local'):
+            return lambda env, local: lambda x : self.expression.interpret_local_variables(env, x)
+        expression = self.expression.compile()
+        intname = self.intname
+        listname = self.listname
+        
+        def function(env, local):
+            def apply(x):
+                set_local_variable(local, x, intname, listname)
+                return expression(env, local)
+            return apply
+        return function
 
 class Argmax(Node):
     def __init__(self, l):
@@ -240,6 +538,21 @@ class Argmax(Node):
     
     def interpret(self, env):
         return np.argmax(self.list.interpret(env))
+    
+    def compile(self):
+        values = self.list.compile()
+        return lambda env, local: fast_argmax(values(env, local))
+    
+    def interpret_batch(self, env, context, local):
+        values = self.list.interpret_batch(env, context, local)
+        if values.kind != 'list' or len(values.masks) != 1 or values.elem not in ('int', 'bool', 'np'):
+            raise NotImplementedError('argmax of nested lists')
+        mask = values.masks[0]
+        context.fail(ERROR_BITS[ValueError], ~mask.any(axis=-1))
+        if mask.shape[-1] == 0:
+            return BatchValue(np.zeros(mask.shape[:-1], dtype=np.intp), context.ndim, 'np')
+        data = np.where(mask, values.data.astype(np.float64), -np.inf)
+        return BatchValue(np.argmax(data, axis=-1), context.ndim, 'np')
 
 class Sum(Node):
     def __init__(self, l):
@@ -252,6 +565,27 @@ class Sum(Node):
     
     def interpret(self, env):
         return np.sum(self.list.interpret(env)) 
+    
+    def compile(self):
+        values = self.list.compile()
+        return lambda env, local: fast_sum(values(env, local))
+    
+    def interpret_batch(self, env, context, local):
+        values = self.list.interpret_batch(env, context, local)
+        if values.kind != 'list' or len(values.masks) > 2 or values.elem not in ('int', 'bool', 'np'):
+            raise NotImplementedError('sum of deeply nested lists')
+        data = values.data.astype(np.int64)
+        if len(values.masks) == 1:
+            return BatchValue(np.where(values.masks[0], data, 0).sum(axis=-1), context.ndim, 'np')
+        # lists of lists are summed whole, and only if they all have the
+        # same length, as np.sum requires
+        outer = values.masks[0]
+        inner = values.masks[1] & outer[..., None]
+        lengths = inner.sum(axis=-1)
+        longest = np.where(outer, lengths, -1).max(axis=-1, initial=-1)
+        shortest = np.where(outer, lengths, lengths.shape[-1] + 1).min(axis=-1, initial=lengths.shape[-1] + 1)
+        context.fail(ERROR_BITS[ValueError], outer.any(axis=-1) & (longest != shortest))
+        return BatchValue(np.where(inner, data, 0).sum(axis=(-1, -2)), context.ndim, 'np')
 
 class Map(Node):
     def __init__(self, function, l):
@@ -276,4 +610,65 @@ class Map(Node):
             list_var = env[self.local][self.listname]
             return list(map(self.function.interpret(env), list_var))
         
-        return list(map(self.function.interpret(env), self.list.interpret(env))) 
\ No newline at end of file
+        return list(map(self.function.interpret(env), self.list.interpret(env)))
+    
+    def compile(self):
+        function = self.function.compile()
+        listname = self.listname
+        if self.list is None:
+            return lambda env, local: list(map(function(env, local), local[listname]))
+        values = self.list.compile()
+        return lambda env, local: list(map(function(env, local), values(env, local)))
+    
+    def interpret_batch(self, env, context, local):
+        if self.list is None:
+            values = read_local(local, self.listname, context)
+            if values is None:
+                values = BatchValue(np.zeros((1,) * context.ndim + (0,), dtype=np.int64),
+                                    context.ndim, 'list', [np.zeros((1,) * context.ndim + (0,), dtype=bool)], 'int')
+        else:
+            values = self.list.interpret_batch(env, context, local)
+        if values.kind != 'list':
+            raise NotImplementedError('map over a scalar')
+        mask = values.masks[0]
+        inner = context.inner(mask)
+        # the elements: the first list axis becomes a context axis
+        if len(values.masks) > 1:
+            element = BatchValue(values.data, inner.ndim, 'list', values.masks[1:], values.elem)
+            name = self.listname
+        else:
+            element = BatchValue(values.data, inner.ndim, values.elem)
+            name = self.intname if values.elem == 'int' else None
+        expression = self.function.expression
+        if not hasattr(expression, 'local'):
+            # interpret_local_variables fails on nodes built without
+            # Node.__init__
+            inner.fail(ERROR_BITS[AttributeError])
+            result = BatchValue(np.zeros(mask.shape, dtype=np.int64), inner.ndim, 'int')
+        else:
+            start = dict(local)
+            if name is not None:
+                start[name] = element
+            body_local = dict(start)
+            result = expression.interpret_batch(env, inner, body_local)
+            rebound = [key for key in body_local if body_local[key] is not start.get(key)]
+            if [key for key in rebound if key != name]:
+                # from the second element on, these hold the last element of
+                # the inner Map of the previous element
+                for key in rebound:
+                    if key != name:
+                        start[key] = STALE
+                body_local = dict(start)
+                result = expression.interpret_batch(env, inner, body_local)
+            for key in rebound:
+                local[key] = STALE
+            if name is not None:
+                # holds the last element mapped, if any
+                local[name] = STALE
+        result = result.align(inner.ndim)
+        # the list axis of the result has the length of the mapped list
+        shape = np.broadcast_shapes(result.data.shape[:inner.ndim], mask.shape)
+        data = np.broadcast_to(result.data, shape + result.data.shape[inner.ndim:])
+        masks = [np.broadcast_to(mask, shape)] + [np.broadcast_to(m, shape + m.shape[inner.ndim:]) for m in result.masks]
+        elem = result.elem if result.kind == 'list' else result.kind
+        return BatchValue(data, context.ndim, 'list', masks, elem) 
\ No newline at end of file
@@ -0,0 +1,375 @@
+import numpy as np
+from game import Game, FINISHED, WON, distinct_moves
+from random_player import RandomPlayer
+from rule_of_28_sketch import Rule_of_28_Player_PS
+from state_corpus import BatchStates, state_dtype, MAX_NEUTRALS
+
+class BatchPolicy:
+    """
+    Player choosing the actions of many games at once. 'rows' are indexes
+    of the games of 'sim' where it is this player's turn.
+    """
+
+    def get_moves(self, sim, rows):
+        """
+        Return two integer arrays with the columns of the chosen dice
+        combination of each row. The second one is 0 for single-column
+        moves. sim.available_moves lists the combinations to choose from.
+        """
+        raise Exception('Unimplemented method: get_moves')
+
+    def get_stops(self, sim, rows):
+        """ Return a boolean array, True where the player chooses 'n'. """
+        raise Exception('Unimplemented method: get_stops')
+
+class RandomBatchPolicy(BatchPolicy):
+    """ Vectorised RandomPlayer: uniform over the available actions. """
+
+    def get_moves(self, sim, rows):
+        moves, n_moves = sim.available_moves(rows)
+        choice = (sim.rng.random(len(rows)) * n_moves).astype(int)
+        return sim.move_columns(moves[np.arange(len(rows)), choice])
+
+    def get_stops(self, sim, rows):
+        return sim.rng.random(len(rows)) < 0.5
+
+class PlayerPolicy(BatchPolicy):
+    """ Any Player, asked one game at a time on a Game copy of the row. """
+
+    def __init__(self, player):
+        self.player = player
+
+    def get_actions(self, sim, rows):
+        return [self.player.get_action(game) for game in sim.to_games(rows)]
+
+    def get_moves(self, sim, rows):
+        actions = self.get_actions(sim, rows)
+        first = np.array([action[0] for action in actions], dtype=np.int64)
+        second = np.array([action[1] if len(action) == 2 else 0 for action in actions], dtype=np.int64)
+        return first, second
+
+    def get_stops(self, sim, rows):
+        return np.array([action == 'n' for action in self.get_actions(sim, rows)], dtype=bool)
+
+class Rule28BatchPolicy(PlayerPolicy):
+    """
+    Rule_of_28_Player_PS deciding all the rows at once with
+    get_actions_batch, and asked one Game copy at a time only for the rows
+    the batch interpreter leaves undecided.
+    """
+
+    def get_actions(self, sim, rows):
+        try:
+            actions = self.player.get_actions_batch(BatchStates(sim.records(rows)))
+        except NotImplementedError:
+            actions = [None] * len(rows)
+        # undecided rows, and the ones where get_action raises an exception
+        ask = [i for (i, action) in enumerate(actions) if action is None or isinstance(action, type)]
+        if ask:
+            for (i, action) in zip(ask, PlayerPolicy.get_actions(self, sim, rows[ask])):
+                actions[i] = action
+        return actions
+
+def as_policy(player):
+    """ Return a BatchPolicy for a BatchPolicy or a Player. """
+
+    if isinstance(player, BatchPolicy):
+        return player
+    if type(player) is RandomPlayer:
+        return RandomBatchPolicy()
+    if type(player) is Rule_of_28_Player_PS:
+        return Rule28BatchPolicy(player)
+    return PlayerPolicy(player)
+
+class BatchSimulator:
+    def __init__(self, n_games, n_players=2, dice_value=6, column_range=[2,12],
+                    offset=2, initial_height=3, max_moves=300, seed=None):
+        """
+        N independent Can't Stop games advanced in lockstep, with the same
+        rules as Game. Column c of a game is index c of its arrays.
+        - progress[g, p, c] is the cell of player p's marker (-1 if none).
+          Index 0 is unused.
+        - neutral[g, c] is the cell of the neutral marker (-1 if none) and
+          neutral_order[g, c] when it was last placed, to list the neutral
+          positions in the same order as Game.
+        - owner[g, c] is the player who finished column c (0 if none) and
+          won[g, c] is True if the current player reached its top this round.
+        - n_neutral, player_turn, dice_action, moves and rolls as in Game.
+        A game stops once it has a winner or after max_moves plays (a draw).
+        """
+
+        self.n_games = n_games
+        self.n_players = n_players
+        self.dice_value = dice_value
+        self.column_range = column_range
+        self.offset = offset
+        self.initial_height = initial_height
+        self.max_moves = max_moves
+        self.rng = np.random.default_rng(seed)
+
+        n_columns = column_range[1] + 1
+        self.heights = np.zeros(n_columns, dtype=np.int64)
+        height = initial_height
+        for x in range(column_range[0], column_range[1]+1):
+            self.heights[x] = height
+            if x < column_range[1]/2 +1:
+                height += offset
+            else:
+                height -= offset
+        # moves are coded as first * n_columns + second
+        self.invalid_code = n_columns * n_columns
+        # available moves of the sequences of codes seen, see available_moves
+        self.move_lists = {}
+
+        self.progress = np.full((n_games, n_players + 1, n_columns), -1, dtype=np.int64)
+        self.neutral = np.full((n_games, n_columns), -1, dtype=np.int64)
+        self.neutral_order = np.zeros((n_games, n_columns), dtype=np.int64)
+        self.owner = np.zeros((n_games, n_columns), dtype=np.int64)
+        self.won = np.zeros((n_games, n_columns), dtype=bool)
+        self.n_neutral = np.zeros(n_games, dtype=np.int64)
+        self.player_turn = np.ones(n_games, dtype=np.int64)
+        self.dice_action = np.ones(n_games, dtype=bool)
+        self.moves = np.zeros(n_games, dtype=np.int64)
+        self.winner = np.zeros(n_games, dtype=np.int64)
+        self.rolls = self.roll_dice(np.arange(n_games))
+        self.placed = 0
+        # settings shared by the Game copies of the rows
+        self.template = Game(n_players, 4, dice_value, column_range, offset, initial_height)
+
+    def roll_dice(self, rows):
+        return self.rng.integers(1, self.dice_value + 1, size=(len(rows), 4))
+
+    def closed(self, rows):
+        return (self.owner[rows] != 0) | self.won[rows]
+
+    def combinations(self, rows):
+        """
+        Return the (rows, 3, 2) column sums of the three pairings of each
+        roll and (rows, 3) masks of the moves Game.available_moves derives
+        from them: the pair, the first column alone, the second alone.
+        """
+
+        r = self.rolls[rows]
+        pairs = np.stack([np.stack([r[:, 0] + r[:, 1], r[:, 2] + r[:, 3]], axis=1),
+                          np.stack([r[:, 0] + r[:, 2], r[:, 1] + r[:, 3]], axis=1),
+                          np.stack([r[:, 0] + r[:, 3], r[:, 1] + r[:, 2]], axis=1)], axis=1)
+        index = np.arange(len(rows))[:, None]
+        closed = self.closed(rows)
+        closed_a = closed[index, pairs[:, :, 0]]
+        closed_b = closed[index, pairs[:, :, 1]]
+        neutral_a = self.neutral[rows][index, pairs[:, :, 0]] != -1
+        neutral_b = self.neutral[rows][index, pairs[:, :, 1]] != -1
+        n = self.n_neutral[rows][:, None]
+        first = ~closed_a & ((n < 3) | neutral_a)
+        second = ~closed_b & ((n < 3) | neutral_b)
+        pair = ~closed_a & ~closed_b & ((n <= 1)
+                                        | ((n == 2) & (neutral_a | neutral_b | (pairs[:, :, 0] == pairs[:, :, 1])))
+                                        | ((n >= 3) & neutral_a & neutral_b))
+        alone_first = ~pair & first
+        alone_second = ~pair & second
+        return pairs, pair, alone_first, alone_second
+
+    def available_moves(self, rows):
+        """
+        Return a (rows, 6, 2) array of the available moves of each row, in
+        the order of Game.available_moves, and the number of moves of each
+        row. Single-column moves and the padding are filled with -1.
+        """
+
+        pairs, pair, alone_first, alone_second = self.combinations(rows)
+        n_columns = len(self.heights)
+        # the moves of each pairing in the order of Game.pairing_moves, coded
+        codes = np.stack([np.where(pair, pairs[:, :, 0] * n_columns + pairs[:, :, 1], self.invalid_code),
+                          np.where(alone_first, pairs[:, :, 0] * n_columns, self.invalid_code),
+                          np.where(alone_second, pairs[:, :, 1] * n_columns, self.invalid_code)], axis=2)
+        codes = codes.reshape(len(rows), -1)
+        moves = np.empty((len(rows), 6, 2), dtype=np.int64)
+        n_moves = np.empty(len(rows), dtype=np.int64)
+        # the order of the moves only depends on the sequence of codes
+        for (i, row_codes) in enumerate(codes):
+            key = row_codes.tobytes()
+            if key not in self.move_lists:
+                combination = [(code // n_columns, code % n_columns) if code % n_columns else (code // n_columns,)
+                               for code in row_codes.tolist() if code != self.invalid_code]
+                listed = np.full((6, 2), -1, dtype=np.int64)
+                available = distinct_moves(combination)
+                for (j, move) in enumerate(available):
+                    listed[j, :len(move)] = move
+                self.move_lists[key] = (listed, len(available))
+            (moves[i], n_moves[i]) = self.move_lists[key]
+        return moves, n_moves
+
+    def move_columns(self, moves):
+        """ Return the two columns of (rows, 2) moves for play_moves. """
+
+        return moves[:, 0], np.where(moves[:, 1] == -1, 0, moves[:, 1])
+
+    def next_turn(self, rows):
+        self.player_turn[rows] = self.player_turn[rows] % self.n_players + 1
+        self.n_neutral[rows] = 0
+
+    def bust(self, rows):
+        """ Erase the neutral markers and won columns and pass the turn. """
+
+        self.neutral[rows] = -1
+        self.won[rows] = False
+        self.next_turn(rows)
+        self.rolls[rows] = self.roll_dice(rows)
+
+    def advance(self, rows, columns):
+        """ Advance one column per row, as one die position of Game.play. """
+
+        turn = self.player_turn[rows]
+        zero = self.neutral[rows, columns]
+        own = self.progress[rows, turn, columns]
+        top = self.heights[columns] - 1
+        place = zero == -1
+        self.n_neutral[rows[place]] += 1
+        current = np.where(place, own, zero)
+        at_top = current == top
+        self.won[rows[at_top], columns[at_top]] = True
+        move = ~at_top
+        self.neutral[rows[move], columns[move]] = current[move] + 1
+        # a neutral marker placed or moved goes to the end of the list
+        self.placed += 1
+        self.neutral_order[rows[move], columns[move]] = self.placed
+
+    def play_moves(self, rows, first, second):
+        self.advance(rows, first)
+        double = second != 0
+        self.advance(rows[double], second[double])
+        self.dice_action[rows] = False
+        self.rolls[rows] = self.roll_dice(rows)
+
+    def stop(self, rows):
+        """ Turn the neutral markers into player markers ('n' action). """
+
+        turn = self.player_turn[rows]
+        index = np.arange(len(rows))[:, None]
+        neutral = self.neutral[rows]
+        has_neutral = neutral != -1
+        progress = self.progress[rows]
+        progress[index, turn[:, None], np.arange(neutral.shape[1])[None, :]] = \
+            np.where(has_neutral, neutral, progress[index, turn[:, None], np.arange(neutral.shape[1])[None, :]])
+        won = self.won[rows]
+        progress[np.broadcast_to(won[:, None, :], progress.shape)] = -1
+        self.progress[rows] = progress
+        owner = self.owner[rows]
+        owner[won] = np.broadcast_to(turn[:, None], won.shape)[won]
+        self.owner[rows] = owner
+        self.neutral[rows] = -1
+        self.won[rows] = False
+        self.dice_action[rows] = True
+        self.next_turn(rows)
+
+    def positions(self, rows):
+        """ Return the Board.positions of each game of 'rows', unpacked. """
+
+        # marker 0 of the board is the neutral one, as progress[:, 0] is unused
+        markers = self.progress[rows]
+        markers[:, 0] = self.neutral[rows]
+        return (markers.transpose(0, 2, 1) + 1).astype(np.uint8)
+
+    def records(self, rows):
+        """ Return the state_corpus records of the games of 'rows'. """
+
+        records = np.zeros(len(rows), dtype=state_dtype(len(self.heights), self.n_players + 1))
+        records['positions'] = self.positions(rows).reshape(len(rows), -1)
+        records['owner'] = self.owner[rows]
+        records['won'] = np.where(self.won[rows], self.player_turn[rows][:, None], 0)
+        # neutral columns in the order they were placed, -1 padded
+        present = self.neutral[rows] != -1
+        order = np.where(present, self.neutral_order[rows], np.iinfo(np.int64).max)
+        columns = np.argsort(order, axis=1, kind='stable')[:, :MAX_NEUTRALS]
+        records['neutrals'] = np.where(np.take_along_axis(present, columns, axis=1), columns, -1)
+        records['n_neutral'] = self.n_neutral[rows]
+        records['player_turn'] = self.player_turn[rows]
+        records['dice_action'] = self.dice_action[rows]
+        records['roll'] = self.rolls[rows]
+        records['moves'] = -1
+        rolling = np.flatnonzero(self.dice_action[rows])
+        if len(rolling):
+            (records['moves'][rolling], records['n_moves'][rolling]) = self.available_moves(rows[rolling])
+        return records
+
+    def to_games(self, rows):
+        """ Return a Game in the same state as each game of 'rows'. """
+
+        positions = self.positions(rows)
+        closed = (np.where(self.owner[rows] != 0, FINISHED, 0) | np.where(self.won[rows], WON, 0)).astype(np.uint8)
+        columns = range(len(self.heights))
+        games = []
+        for (i, turn, owner, won, neutral, order, n_neutral, dice_action, roll) in zip(
+                range(len(rows)), self.player_turn[rows].tolist(), self.owner[rows].tolist(),
+                self.won[rows].tolist(), self.neutral[rows].tolist(),
+                self.neutral_order[rows].tolist(), self.n_neutral[rows].tolist(),
+                self.dice_action[rows].tolist(), self.rolls[rows].tolist()):
+            game = self.template.clone()
+            game.board_game.positions = bytearray(positions[i].tobytes())
+            game.closed_columns = bytearray(closed[i].tobytes())
+            game.player_turn = turn
+            game.finished_columns = [(c, owner[c]) for c in columns if owner[c]]
+            game.player_won_column = [(c, turn) for c in columns if won[c]]
+            neutrals = sorted([c for c in columns if neutral[c] != -1], key=lambda c: order[c])
+            game.neutral_positions = [(c, neutral[c]) for c in neutrals]
+            game.n_neutral_markers = n_neutral
+            game.dice_action = dice_action
+            game.current_roll = tuple(roll)
+            games.append(game)
+        return games
+
+    def run(self, policies, seats):
+        """
+        Play every game to the end.
+        - policies is a list of BatchPolicy.
+        - seats[g, p-1] is the index in policies of player p of game g.
+        Return the winner of each game (0 for a draw).
+        """
+
+        active = np.ones(self.n_games, dtype=bool)
+        while active.any():
+            rows = np.flatnonzero(active)
+            # bust check before choosing a dice combination
+            rolling = rows[self.dice_action[rows]]
+            if len(rolling):
+                _, pair, alone_first, alone_second = self.combinations(rolling)
+                busted = ~(pair | alone_first | alone_second).any(axis=1)
+                self.bust(rolling[busted])
+                rows = np.setdiff1d(rows, rolling[busted])
+            # split the rows before playing: a stop passes the turn
+            seat = seats[rows, self.player_turn[rows] - 1]
+            for (policy_index, policy) in enumerate(policies):
+                mine = rows[seat == policy_index]
+                rolling = mine[self.dice_action[mine]]
+                deciding = mine[~self.dice_action[mine]]
+                if len(rolling):
+                    first, second = policy.get_moves(self, rolling)
+                    self.play_moves(rolling, first, second)
+                if len(deciding):
+                    stops = policy.get_stops(self, deciding)
+                    self.stop(deciding[stops])
+                    self.dice_action[deciding[~stops]] = True
+            self.moves[rows] += 1
+            # winners, then draws
+            finished = np.stack([(self.owner[rows] == p).sum(axis=1) for p in range(1, self.n_players + 1)], axis=1) >= 3
+            over = finished.any(axis=1)
+            self.winner[rows[over]] = np.argmax(finished[over], axis=1) + 1
+            active[rows[over]] = False
+            active[rows[self.moves[rows] >= self.max_moves]] = False
+        return self.winner
+
+def play_n_matches_batch(p1, p2, n, seed=None):
+    """
+    Batch version of main_starter.play_n_matches: n games with p1 as player
+    1 and n games with p2 as player 1, all in lockstep. p1 and p2 are
+    Player or BatchPolicy objects. Return the victories of p1 and p2.
+    """
+
+    sim = BatchSimulator(2 * n, seed=seed)
+    seats = np.zeros((2 * n, 2), dtype=np.int64)
+    seats[:n] = [0, 1]
+    seats[n:] = [1, 0]
+    winner = sim.run([as_policy(p1), as_policy(p2)], seats)
+    p1_victories = int((winner[:n] == 1).sum() + (winner[n:] == 2).sum())
+    p2_victories = int((winner[:n] == 2).sum() + (winner[n:] == 1).sum())
+    return p1_victories, p2_victories
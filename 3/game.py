@@ -1,38 +1,113 @@
 import numpy as np
+import itertools
 import random
-import copy
-import pickle
 
 class Cell:
-    def __init__(self):
+    def __init__(self, markers=None):
         """
         A list of markers.
         Neutral markers are represented as 0.
         Markers from Player 1 are represented as 1, and so forth.
+        Cells handed out by Board.board are read-only views.
         """
 
-        self.markers = []
+        self.markers = [] if markers is None else markers
+
+class CellView(Cell):
+    def __init__(self, markers):
+        """
+        Read-only Cell of Board.board: markers is a tuple and the attributes
+        can't be set, so writes fail instead of being lost. Change the board
+        with Board.set_position.
+        """
+
+        object.__setattr__(self, 'markers', tuple(markers))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('cells of Board.board are read-only, use Board.set_position')
+
+class BoardColumns:
+    def __init__(self, board):
+        """
+        Read-only view of the board: one tuple of CellView per column.
+        """
+
+        self._board = board
+
+    def __len__(self):
+        return len(self._board.heights)
+
+    def __getitem__(self, x):
+        board = self._board
+        cells = [[] for _ in range(board.heights[x])]
+        for marker in range(board.n_markers):
+            position = board.get_position(x, marker)
+            if position != -1:
+                cells[position].append(marker)
+        return tuple(CellView(markers) for markers in cells)
+
+    def __iter__(self):
+        for x in range(len(self)):
+            yield self[x]
 
 class Board:
-    def __init__(self, column_range, offset, initial_height):
+    def __init__(self, column_range, offset, initial_height, n_players=2):
         """
         First two columns are unused.
         Used columns vary from range 2 to 12 (inclusive).
+        Each column holds at most one neutral marker and one marker per
+        player, so the board is stored as one byte per (column, marker):
+        the cell index of the marker plus one, or 0 if it is not on the
+        column. Marker 0 is the neutral one.
         """
 
         self.column_range = column_range
         self.offset = offset
         self.initial_height = initial_height
+        self.n_markers = n_players + 1
 
         height = self.initial_height
-        self.board = [[] for _ in range(self.column_range[1]+1)]
+        self.heights = [0] * (self.column_range[1]+1)
         for x in range(self.column_range[0],self.column_range[1]+1):
-            for _ in range(height):
-                self.board[x].append(Cell())
+            self.heights[x] = height
             if x < self.column_range[1]/2 +1:
                 height += self.offset
             else:
                 height -= self.offset
+        self.positions = bytearray(len(self.heights) * self.n_markers)
+
+    @property
+    def board(self):
+        """
+        Columns of read-only Cell views, as in the list-of-lists board. It
+        can't be changed through them: use set_position.
+        """
+
+        return BoardColumns(self)
+
+    def copy(self):
+        """ Return a copy of this board. Only the positions are copied. """
+
+        board = Board.__new__(Board)
+        board.__dict__.update(self.__dict__)
+        board.positions = bytearray(self.positions)
+        return board
+
+    def get_position(self, column, marker):
+        """ Return the cell index of 'marker' in 'column', or -1. """
+
+        return self.positions[column * self.n_markers + marker] - 1
+
+    def set_position(self, column, marker, position):
+        """ Place 'marker' on cell 'position' of 'column' (-1 removes it). """
+
+        self.positions[column * self.n_markers + marker] = position + 1
+
+    def clear_column(self, column):
+        """ Remove every marker from 'column'. """
+
+        start = column * self.n_markers
+        self.positions[start:start + self.n_markers] = bytes(self.n_markers)
 
     def print_board(self, rows, finished_columns):
         """
@@ -57,7 +132,7 @@ class Board:
                     print('[', player_completed_rows[completed_rows.index(x)], ']', sep='',end='')
             else:
                 for cell in list_of_cells:
-                    print(cell.markers, end='')
+                    print(list(cell.markers), end='')
                 if x in partial_completed_rows:
                     print('*', end='')
             print()
@@ -65,24 +140,82 @@ class Board:
     def check_board_equality(self, board_2):
         """ Check if two boards are equal. """
 
-        height = self.initial_height
-        for x in range(self.column_range[0],self.column_range[1]+1):
-            list_of_cells = self.board[x]
-            list_of_cells_2 = board_2.board[x]
-            for i in range(len(list_of_cells)):
-                # Check if all Cell in [x] are equal
-                if sorted(list_of_cells[i].markers) \
-                    != sorted(list_of_cells_2[i].markers):
-                    return False
-            if x < self.column_range[1]/2 +1:
-                height += self.offset
-            else:
-                height -= self.offset
-        return True
+        return self.positions == board_2.positions
+
+# flags of Game.closed_columns
+FINISHED = 1
+WON = 2
+
+def roll_entry(roll):
+    """ Return the table entry of a 4-dice roll: its three pairings. """
+
+    return [(roll[0] + roll[1], roll[2] + roll[3]),
+            (roll[0] + roll[2], roll[1] + roll[3]),
+            (roll[0] + roll[3], roll[1] + roll[2])]
+
+# Pairings of all 1296 rolls of four six-sided dice. Rolls of other dice
+# are added when first seen.
+ROLL_TABLE = {roll: roll_entry(roll) for roll in itertools.product(range(1, 7), repeat=4)}
+
+# Moves allowed for one pairing, before duplicates are removed, keyed by
+# the pairing, the number of neutral markers (0 and 1 alike) and the state
+# of its two columns (see Game.combine_moves). It holds at most 27 entries
+# per pairing of columns, however many games are played.
+PAIRING_MOVES = {}
+
+def distinct_moves(combination):
+    """
+    Return the moves of 'combination', the moves of the three pairings of a
+    roll, without duplicates and in the order of Game.available_moves.
+    """
+
+    # Remove duplicate actions (Example: dice = (2,6,6,6) will give 
+    # actions = [(8,12), (8,12), (8,12)])
+    # Also remove redundant actions (Example: (8,12) and (12,8))
+
+    return [t for t in {x[::-1] if x[0] > x[-1] else x for x in combination}]
+
+class DiceStream:
+    def __init__(self, seed, dice_number=4, dice_value=6):
+        """
+        Fixed sequence of dice rolls drawn from its own generator, so that
+        games given streams with the same seed see the same i-th roll.
+        Rolls are generated when first needed and kept in 'rolls', which
+        copies of the stream share.
+        """
+
+        self.random = random.Random(seed)
+        self.dice_number = dice_number
+        self.dice_value = dice_value
+        self.rolls = []
+        self.index = 0
+
+    def roll(self):
+        """ Return the next roll of the stream. """
+
+        while self.index >= len(self.rolls):
+            self.rolls.append(tuple(self.random.randrange(1, self.dice_value+1)
+                                    for _ in range(self.dice_number)))
+        self.index += 1
+        return self.rolls[self.index - 1]
+
+    def copy(self):
+        """ Return a stream at the same position, sharing the rolls. """
+
+        stream = DiceStream.__new__(DiceStream)
+        stream.__dict__.update(self.__dict__)
+        return stream
+
+    def restart(self):
+        """ Return a stream replaying the same rolls from the first one. """
+
+        stream = self.copy()
+        stream.index = 0
+        return stream
 
 class Game:
     def __init__(self, n_players, dice_number, dice_value, column_range,
-                    offset, initial_height):
+                    offset, initial_height, dice=None):
         """
         - n_players is the number of players (only 2 is possible).
         - dice_number is the number of dice used in the Can't Stop game.
@@ -102,7 +235,16 @@ class Game:
           board.
         - neutral_positions is a 2-tuple storing where the neutral markers are
           stored in the board (column index, cell index).
+        - closed_columns holds a flag per column index: FINISHED if the column
+          is in finished_columns, WON if it is in player_won_column. It is
+          kept in step with both lists.
         - current_roll refers to all dice_number dice roll.
+        - dice is a DiceStream the rolls are taken from. If None, they are
+          drawn from the random module.
+        - features caches per-column quantities of the current state read by
+          the strategy DSL, keyed by (name, column). It is emptied by play
+          and set_manual_board; code changing the state otherwise must call
+          clear_features.
         """
 
         self.n_players = n_players
@@ -111,8 +253,9 @@ class Game:
         self.column_range = column_range 
         self.offset = offset
         self.initial_height = initial_height
-        self.board_game = Board(self.column_range, self.offset, 
-                                self.initial_height
+        self.dice = dice
+        self.board_game = Board(self.column_range, self.offset,
+                                self.initial_height, self.n_players
                                 )
         self.player_turn = 1
         self.finished_columns = []
@@ -121,7 +264,9 @@ class Game:
         self.current_roll = self.roll_dice()
         self.n_neutral_markers = 0
         self.neutral_positions = []
-        self.actions_taken = [] 
+        self.closed_columns = bytearray(self.column_range[1]+1)
+        self.actions_taken = []
+        self.features = {} 
     
     def check_game_equality(self, game):
         """ Check if self and 'game' represents the same state. """
@@ -132,20 +277,25 @@ class Game:
                 sorted(self.neutral_positions) == sorted(game.neutral_positions)
 
     def set_manual_board(self, manual_board, finished_columns, player_won_column):
-        """ Set a manual board in matrix form. """
+        """
+        Set a manual board in matrix form. A marker found in more than one
+        cell of a column is kept at the last one.
+        """
 
         self.finished_columns = finished_columns
         self.player_won_column = player_won_column
-        height = self.initial_height
+        self.clear_features()
+        self.closed_columns = bytearray(self.column_range[1]+1)
+        for column_finished in finished_columns:
+            self.closed_columns[column_finished[0]] |= FINISHED
+        for column_won in player_won_column:
+            self.closed_columns[column_won[0]] |= WON
         for x in range(self.column_range[0],self.column_range[1]+1):
-            list_of_cells = self.board_game.board[x]
+            self.board_game.clear_column(x)
             list_of_cells_2 = manual_board[x-2]
-            for i in range(len(list_of_cells)):
-                list_of_cells[i].markers = list_of_cells_2[i]
-            if x < self.column_range[1]/2 +1:
-                height += self.offset
-            else:
-                height -= self.offset
+            for i in range(self.board_game.heights[x]):
+                for marker in list_of_cells_2[i]:
+                    self.board_game.set_position(x, marker, i)
 
     def check_boardgame_equality(self, game):
         """ Check if self board and 'game.board' represents the same board."""
@@ -163,9 +313,23 @@ class Game:
         self.board_game.print_board(self.player_won_column, self.finished_columns)
 
     def clone(self):
-        """Return a "deepcopy" of this game. Used for MCTS routines."""
-        
-        return pickle.loads(pickle.dumps(self, -1))
+        """
+        Return a "deepcopy" of this game. Used for MCTS routines.
+        The board is copied as one buffer and the settings are shared.
+        """
+
+        game = Game.__new__(Game)
+        game.__dict__.update(self.__dict__)
+        game.board_game = self.board_game.copy()
+        game.finished_columns = list(self.finished_columns)
+        game.player_won_column = list(self.player_won_column)
+        game.neutral_positions = list(self.neutral_positions)
+        game.closed_columns = bytearray(self.closed_columns)
+        game.actions_taken = list(self.actions_taken)
+        game.features = dict(self.features)
+        if self.dice is not None:
+            game.dice = self.dice.copy()
+        return game
 
     def play(self, chosen_play):
         """
@@ -173,6 +337,7 @@ class Game:
         Depending on the play and dice roll, it will change player_turn.
         """
         
+        self.clear_features()
         if chosen_play == 'n':
             self.transform_neutral_markers()
             # Next action should be to choose a dice combination
@@ -184,41 +349,38 @@ class Game:
             return
         if self.is_player_busted(self.available_moves()):
             return
+        board = self.board_game
         for die_position in range(len(chosen_play)):
-            current_position_zero = -1
-            current_position_id = -1
             col = chosen_play[die_position]
-            cell_list = self.board_game.board[col]
-            for i in range(0, len(cell_list)):
-                if 0 in cell_list[i].markers:
-                    current_position_zero = i
-                if self.player_turn in cell_list[i].markers:
-                    current_position_id = i
+            current_position_zero = board.get_position(col, 0)
+            current_position_id = board.get_position(col, self.player_turn)
+            top = board.heights[col] - 1
 
             # If there's no zero and no player_id marker
             if current_position_zero == current_position_id == -1:
-                cell_list[0].markers.append(0)
+                board.set_position(col, 0, 0)
                 self.n_neutral_markers += 1
                 self.neutral_positions.append((col, 0))
             # If there's no zero but there is player id marker
             elif current_position_zero == -1:
                 #First check if the player will win that column
                 self.n_neutral_markers += 1
-                if current_position_id == len(cell_list) - 1:
+                if current_position_id == top:
                     if (col, self.player_turn) not in self.player_won_column:
                         self.player_won_column.append((col, self.player_turn))
+                        self.closed_columns[col] |= WON
                 else:
-                    cell_list[current_position_id+1].markers.append(0)
+                    board.set_position(col, 0, current_position_id+1)
                     self.neutral_positions.append((col, current_position_id+1))
-            # If there's zero    
+            # If there's zero
             else:
                 #First check if the player will win that column
-                if current_position_zero == len(cell_list) - 1:
+                if current_position_zero == top:
                     if (col, self.player_turn) not in self.player_won_column:
                         self.player_won_column.append((col, self.player_turn))
+                        self.closed_columns[col] |= WON
                 else:
-                    cell_list[current_position_zero].markers.remove(0)
-                    cell_list[current_position_zero+1].markers.append(0)
+                    board.set_position(col, 0, current_position_zero+1)
                     self.neutral_positions.remove((col, current_position_zero))
                     self.neutral_positions.append((col, current_position_zero+1))
         # Next action should be [y,n]
@@ -230,18 +392,13 @@ class Game:
     def transform_neutral_markers(self):
         """Transform the neutral markers into player_id markers (1 or 2)."""
 
+        self.clear_features()
+
         for neutral in self.neutral_positions:
-            markers = self.board_game.board[neutral[0]][neutral[1]].markers
-            for i in range(len(markers)):
-                if markers[i] == 0:
-                    markers[i] = self.player_turn
-            # Remove the previous player_turn id in order to keep only the
-            # the furthest one
-            col_cell_list = self.board_game.board[neutral[0]]
-            for i in range(neutral[1]-1, -1, -1):
-                if self.player_turn in col_cell_list[i].markers:
-                    col_cell_list[i].markers.remove(self.player_turn)
-                    break
+            # The player_turn marker moves up to the neutral one, so only
+            # the furthest one is kept
+            self.board_game.set_position(neutral[0], self.player_turn, neutral[1])
+            self.board_game.set_position(neutral[0], 0, -1)
 
         # Special case example: Player 1 is about to win, for ex. column 7 
         # but they rolled a (7,7) tuple. That would add two instances (1,7) 
@@ -254,10 +411,9 @@ class Game:
 
         for column_won in self.player_won_column:
             self.finished_columns.append((column_won[0], column_won[1]))
+            self.closed_columns[column_won[0]] = FINISHED
         
-            for cell in self.board_game.board[column_won[0]]:
-                cell.markers.clear()
-                #cell.markers.append(self.player_turn)
+            self.board_game.clear_column(column_won[0])
     
 
         self.player_won_column.clear()
@@ -274,15 +430,97 @@ class Game:
     def erase_neutral_markers(self):
         """Remove the neutral markers because the player is busted."""
 
+        self.clear_features()
+
         for neutral in self.neutral_positions:
-            markers = self.board_game.board[neutral[0]][neutral[1]].markers
-            if 0 in markers:
-                markers.remove(0)
+            self.board_game.set_position(neutral[0], 0, -1)
 
         self.n_neutral_markers = 0
         self.neutral_positions = []
 
 
+    def clear_won_columns(self):
+        """Forget the columns won in the current round."""
+
+        self.clear_features()
+
+        for column_won in self.player_won_column:
+            self.closed_columns[column_won[0]] &= ~WON
+        self.player_won_column.clear()
+
+
+    def clear_features(self):
+        """
+        Forget the cached features of the previous state. Called by every
+        method changing the board, the neutral markers, the won columns or
+        the player turn.
+        """
+
+        self.features = {}
+
+    def number_advanced_this_round(self, column):
+        """
+        Return the number of positions advanced in this round for a given
+        column by the player. Cached in features.
+        """
+
+        key = ('advanced', column)
+        if key in self.features:
+            return self.features[key]
+        previously_conquered = self.board_game.get_position(column, self.player_turn)
+        neutral_position = self.board_game.get_position(column, 0)
+        won = 0
+        for won_column in self.player_won_column:
+            if won_column[0] == column:
+                won += 1
+        counter = 0
+        if previously_conquered == -1 and neutral_position != -1:
+            counter += neutral_position + 1 + won
+        elif previously_conquered != -1 and neutral_position != -1:
+            counter += neutral_position - previously_conquered + won
+        elif previously_conquered != -1 and neutral_position == -1:
+            counter += won * (self.board_game.heights[column] - previously_conquered)
+        self.features[key] = counter
+        return counter
+
+    def is_new_neutral(self, column):
+        """
+        Return a boolean representing if an action on 'column' will place a
+        new neutral marker. Cached in features.
+        """
+
+        key = ('new_neutral', column)
+        if key not in self.features:
+            self.features[key] = all(neutral[0] != column for neutral in self.neutral_positions)
+        return self.features[key]
+
+
+    def count_finished_after_n(self):
+        """
+        Return the number of columns the current player would have finished
+        if they chose 'n' now: the finished ones and the ones won in this
+        round. The state is not changed.
+        """
+
+        won_this_round = {column_won for column_won in self.player_won_column
+                          if column_won[1] == self.player_turn}
+        finished = 0
+        for column_finished in self.finished_columns:
+            if column_finished[1] == self.player_turn:
+                finished += 1
+        return finished + len(won_this_round)
+
+    def available_columns(self):
+        """
+        Return the columns that are neither finished nor holding a neutral
+        marker, in increasing order.
+        """
+
+        return [x for x in range(self.column_range[0], self.column_range[1]+1)
+                if not self.closed_columns[x] & FINISHED
+                and self.board_game.get_position(x, 0) == -1]
+
+
     def count_neutral_markers(self):
         """Return the number of neutral markers present in the current board."""
         return self.n_neutral_markers
@@ -300,7 +538,7 @@ class Game:
         	return False
         if len(all_moves) == 0:
             self.erase_neutral_markers()
-            self.player_won_column.clear()
+            self.clear_won_columns()
             if self.player_turn == self.n_players:
                 self.player_turn = 1
             else:
@@ -312,12 +550,10 @@ class Game:
             return False
         for move in all_moves:
             for i in range(len(move)):
-                list_of_cells = self.board_game.board[move[i]]
-                for cell in list_of_cells:
-                    if 0 in cell.markers:
-                        return False
+                if self.board_game.get_position(move[i], 0) != -1:
+                    return False
         self.erase_neutral_markers()
-        self.player_won_column.clear()
+        self.clear_won_columns()
         if self.player_turn == self.n_players:
             self.player_turn = 1
         else:
@@ -330,6 +566,8 @@ class Game:
     def roll_dice(self):
         """Return a tuple with integers representing the dice roll."""
 
+        if self.dice is not None:
+            return self.dice.roll()
         my_list = []
         for _ in range(0,self.dice_number):
           my_list.append(random.randrange(1,self.dice_value+1))
@@ -344,12 +582,8 @@ class Game:
         """
 
         #First check if the column 'value' is already completed
-        for tuple_finished in self.finished_columns:
-            if tuple_finished[0] == tuple[0] or tuple_finished[0] == tuple[1]:
-                return False
-        for tuple_column in self.player_won_column:
-            if tuple_column[0] == tuple[0] or tuple_column[0] == tuple[1]:
-                return False
+        if self.closed_columns[tuple[0]] or self.closed_columns[tuple[1]]:
+            return False
 
         # Variables to store if there is a neutral marker in tuples columns.
         is_first_value_valid = False
@@ -357,13 +591,11 @@ class Game:
 
         neutral_markers = self.count_neutral_markers()
 
-        for cell in self.board_game.board[tuple[0]]:
-            if 0 in cell.markers:
-                is_first_value_valid = True
-        
-        for cell in self.board_game.board[tuple[1]]:
-            if 0 in cell.markers:
-                is_second_value_valid = True
+        if self.board_game.get_position(tuple[0], 0) != -1:
+            is_first_value_valid = True
+
+        if self.board_game.get_position(tuple[1], 0) != -1:
+            is_second_value_valid = True
 
         if neutral_markers == 0 or neutral_markers == 1:
             return True
@@ -392,20 +624,12 @@ class Game:
         """
 
         #First check if the column 'value' is already completed
-        for tuple_finished in self.finished_columns:
-            if tuple_finished[0] == value:
-                return False
-        for tuple_column in self.player_won_column:
-            if tuple_column[0] == value:
-                return False
+        if self.closed_columns[value]:
+            return False
         
         if self.count_neutral_markers() < 3:
             return True
-        list_of_cells = self.board_game.board[value]
-        for cell in list_of_cells:
-            if 0 in cell.markers:
-                return True
-        return False
+        return self.board_game.get_position(value, 0) != -1
 
 
     def available_moves(self):
@@ -420,31 +644,55 @@ class Game:
 
         if not self.dice_action:
             return ['y','n']
-        standard_combination = [(self.current_roll[0] + self.current_roll[1], 
-        						self.current_roll[2] + self.current_roll[3]),
-                                (self.current_roll[0] + self.current_roll[2], 
-                                self.current_roll[1] + self.current_roll[3]),
-                                (self.current_roll[0] + self.current_roll[3], 
-                                self.current_roll[1] + self.current_roll[2])]
+        if self.current_roll not in ROLL_TABLE:
+            ROLL_TABLE[self.current_roll] = roll_entry(self.current_roll)
+        return self.combine_moves(ROLL_TABLE[self.current_roll])
+
+    def combine_moves(self, standard_combination):
+        """
+        Return the moves allowed by the current board for the three pairings
+        of a roll, without duplicates.
+        """
+
+        # The moves of a pairing only depend on the number of neutral
+        # markers and, for both its columns, whether the column is closed,
+        # has a neutral marker or neither. Cache them under that key.
+        n_neutral = self.n_neutral_markers
+        neutrals = 1 if n_neutral < 2 else n_neutral
+        closed = self.closed_columns
+        # neutral marker entries of Board.positions, 0 if not on the column
+        positions = self.board_game.positions
+        n_markers = self.board_game.n_markers
         combination = []
         for comb in standard_combination:
-            first_value_available = self.check_value_availability(comb[0])
-            second_value_available = self.check_value_availability(comb[1])
-            if self.check_tuple_availability(comb):
-                combination.append(comb)
-            elif first_value_available and second_value_available:
-                combination.append((comb[0],))
-                combination.append((comb[1],))
-            if first_value_available and not second_value_available:
-                combination.append((comb[0],))
-            if second_value_available and not first_value_available:
-                combination.append((comb[1],))
-
-        # Remove duplicate actions (Example: dice = (2,6,6,6) will give 
-        # actions = [(8,12), (8,12), (8,12)])
-        # Also remove redundant actions (Example: (8,12) and (12,8))
-
-        return [t for t in {x[::-1] if x[0] > x[-1] else x for x in combination}]
+            (first, second) = comb
+            key = (comb, neutrals,
+                   2 if closed[first] else positions[first * n_markers] != 0,
+                   2 if closed[second] else positions[second * n_markers] != 0)
+            if key not in PAIRING_MOVES:
+                PAIRING_MOVES[key] = tuple(self.pairing_moves(comb))
+            combination += PAIRING_MOVES[key]
+        return distinct_moves(combination)
+
+    def pairing_moves(self, comb):
+        """
+        Return the moves allowed by the current board for the pairing 'comb'
+        of a roll, a 2-tuple of columns.
+        """
+
+        combination = []
+        first_value_available = self.check_value_availability(comb[0])
+        second_value_available = self.check_value_availability(comb[1])
+        if self.check_tuple_availability(comb):
+            combination.append(comb)
+        elif first_value_available and second_value_available:
+            combination.append((comb[0],))
+            combination.append((comb[1],))
+        if first_value_available and not second_value_available:
+            combination.append((comb[0],))
+        if second_value_available and not first_value_available:
+            combination.append((comb[1],))
+        return combination
 
     def is_finished(self):
         """
@@ -1,13 +1,15 @@
+import math
 import random
 import time
-from game import Game
+import multiprocessing
+from game import Game, DiceStream
 from random_player import RandomPlayer
 from rule_of_28_sketch import Rule_of_28_Player_PS
 from DSL import *
 
-def play_match(p1, p2):
+def play_match(p1, p2, dice=None, record=None):
     game = Game(n_players = 2, dice_number = 4, dice_value = 6, column_range = [2,12],
-                offset = 2, initial_height = 3)
+                offset = 2, initial_height = 3, dice = dice)
     
     is_over = False
     who_won = None
@@ -23,6 +25,8 @@ def play_match(p1, p2):
                 current_player = 1
             continue
         else:
+            if record is not None:
+                record(game)
             if game.player_turn == 1:
                 chosen_play = p1.get_action(game)
             else:
@@ -69,6 +73,116 @@ def play_n_matches(p1, p2, n):
     
     return p1_victories, p2_victories
 
+def play_seeded_matches(p1, p2, seed, start, stop):
+    """
+    Play the match pairs start..stop-1 of play_n_matches (p1 as player 1,
+    then p2 as player 1). The global random module, used by RandomPlayer,
+    is reseeded from (seed, pair) before each pair, so a pair always plays
+    out the same wherever it runs. Its state is restored afterwards, so
+    the caller's random stream is not reset when this runs in-process.
+    Both matches of a pair roll the dice of the same DiceStream, seeded by
+    (seed, pair) only: any two players compared with the same seed play
+    on the same dice (common random numbers), which removes most of the
+    luck from the difference of their win rates.
+    Return the victories of p1 and p2 and the number of draws.
+    """
+
+    p1_victories = 0
+    p2_victories = 0
+    draws = 0
+    state = random.getstate()
+    try:
+        for pair in range(start, stop):
+            random.seed(f'{seed}-{pair}')
+            dice = DiceStream(f'{seed}-{pair}-dice')
+            for (first, p1_first) in [(p1, True), (p2, False)]:
+                second = p2 if p1_first else p1
+                finished, who_won = play_match(first, second, dice.restart())
+                if not finished:
+                    draws += 1
+                elif (who_won == 1) == p1_first:
+                    p1_victories += 1
+                else:
+                    p2_victories += 1
+    finally:
+        random.setstate(state)
+    return p1_victories, p2_victories, draws
+
+class MatchRunner:
+    def __init__(self, seed=0, workers=None):
+        """
+        Runs play_n_matches over a process pool.
+        - seed is the master seed. Each call without its own seed gets the
+          next seed of a stream derived from it, so a sequence of calls is
+          reproducible.
+        - workers is the pool size (all cores if None). With 1 worker the
+          matches are played in this process.
+        The results of a call only depend on its seed and n, not on the
+        number of workers.
+        """
+
+        self.seed = seed
+        self.workers = workers or multiprocessing.cpu_count()
+        self.seeds = random.Random(seed)
+        self.pool = None
+        if self.workers > 1:
+            self.pool = multiprocessing.Pool(self.workers)
+
+    def next_seed(self):
+        return self.seeds.getrandbits(64)
+
+    def play_n_matches(self, p1, p2, n, seed=None, first=0):
+        """
+        Play n match pairs between p1 and p2 as play_n_matches does: the
+        pairs first..first+n-1 of the seed, so that consecutive calls with
+        the same seed continue one another.
+        Return the victories of p1 and p2 and the number of draws.
+        """
+
+        if seed is None:
+            seed = self.next_seed()
+        if self.pool is None or n < 2:
+            return play_seeded_matches(p1, p2, seed, first, first + n)
+        # one chunk per worker, so the players are sent once to each
+        n_chunks = min(self.workers, n)
+        bounds = [first + n * i // n_chunks for i in range(n_chunks + 1)]
+        chunks = [(p1, p2, seed, bounds[i], bounds[i+1]) for i in range(n_chunks)]
+        results = self.pool.starmap(play_seeded_matches, chunks)
+        return tuple(sum(counts) for counts in zip(*results))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+class SPRT:
+    def __init__(self, p0, p1, alpha=0.05, beta=0.05):
+        """
+        Wald's sequential probability ratio test on the success rate p of
+        Bernoulli trials (e.g. games won), of H0: p = p0 against
+        H1: p = p1 with p1 > p0.
+        - alpha is the probability of accepting H1 when H0 holds.
+        - beta is the probability of accepting H0 when H1 holds.
+        """
+
+        self.p0 = p0
+        self.p1 = p1
+        self.success = math.log(p1 / p0)
+        self.failure = math.log((1 - p1) / (1 - p0))
+        self.upper = math.log((1 - beta) / alpha)
+        self.lower = math.log(beta / (1 - alpha))
+
+    def decide(self, successes, failures):
+        """ Return True (H1), False (H0) or None if more trials are needed. """
+
+        llr = successes * self.success + failures * self.failure
+        if llr >= self.upper:
+            return True
+        if llr <= self.lower:
+            return False
+        return None
+
 
 if __name__ == "__main__":    
     
@@ -20,6 +20,24 @@ class Rule_of_28_Player_PS(Player):
                 
         self.program_yes_no = program_yes_no
         self.program_decide_column = program_decide_column
+        self.compile_programs()
+
+    def compile_programs(self):
+        """ Compile both programs into the functions get_action calls. """
+
+        self.yes_no = compile_program(self.program_yes_no) if self.program_yes_no is not None else None
+        self.decide_column = compile_program(self.program_decide_column) if self.program_decide_column is not None else None
+
+    def __getstate__(self):
+        # compiled functions are closures, which can't be pickled
+        state = dict(self.__dict__)
+        del state['yes_no']
+        del state['decide_column']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.compile_programs()
 
     def init_env(self):
         env = {}
@@ -47,7 +65,7 @@ class Rule_of_28_Player_PS(Player):
                 return 'y'
             else:
                 env = self.init_env()
-                score = self.program_yes_no.interpret(env)
+                score = self.yes_no(env)
 
                 if score >= self.threshold:
                     return 'n'
@@ -55,24 +73,65 @@ class Rule_of_28_Player_PS(Player):
                     return 'y'
         else:           
             env = self.init_env()
-            action_chosen = self.actions[self.program_decide_column.interpret(env)]
+            action_chosen = self.actions[self.decide_column(env)]
             
             return action_chosen
 
 
+    def get_actions_batch(self, states):
+        """
+        Return get_action for every state of 'states', a BatchStates of one
+        kind of decision, with the programs run by the batch interpreter.
+        An entry is the action, the type of the exception get_action raises,
+        or None if it must be asked to get_action. Raise NotImplementedError
+        if the batch interpreter doesn't support the program.
+        """
+
+        if states.n_states == 0:
+            return []
+        env = {}
+        env['state'] = states
+        env['progress_value'] = self.progress_value
+        env['actions'] = states.actions_value()
+        env['marker'] = self.marker
+        env['move_value'] = self.move_value
+        env['neutrals'] = states.neutrals_value()
+
+        if states.dice_action.all():
+            values, outcomes = interpret_batch(self.program_decide_column, env, states.n_states)
+            actions = []
+            for (i, (value, outcome)) in enumerate(zip(values.tolist(), outcomes)):
+                if outcome is FALLBACK:
+                    actions.append(None)
+                elif outcome is not None:
+                    actions.append(outcome)
+                elif value < states.n_moves[i]:
+                    actions.append(states.action(i, value))
+                else:
+                    actions.append(IndexError)
+            return actions
+
+        will_win = states.count_finished_after_n() == 3
+        available = (states.n_neutral != 3) & states.has_available_columns()
+        values, outcomes = interpret_batch(self.program_yes_no, env, states.n_states)
+        actions = []
+        for (i, (value, outcome)) in enumerate(zip(values.tolist(), outcomes)):
+            if will_win[i]:
+                actions.append('n')
+            elif available[i]:
+                actions.append('y')
+            elif outcome is FALLBACK:
+                actions.append(None)
+            elif outcome is not None:
+                actions.append(outcome)
+            else:
+                actions.append('n' if value >= self.threshold else 'y')
+        return actions
+
     def get_available_columns(self):
         """ Return a list of all available columns. """
 
-        # List containing all columns, remove from it the columns that are
-        # available given the current board
-        available_columns = [2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]
-        for neutral in self._state.neutral_positions:
-            available_columns.remove(neutral[0])
-        for finished in self._state.finished_columns:
-            if finished[0] in available_columns:
-                available_columns.remove(finished[0])
-
-        return available_columns
+        return self._state.available_columns()
 
     def will_player_win_after_n(self):
         """ 
@@ -80,17 +139,8 @@ class Rule_of_28_Player_PS(Player):
         if they choose to stop playing the current round (i.e.: choose the 
         'n' action). 
         """
-        clone_state = self._state.clone()
-        clone_state.play('n')
-        won_columns = 0
-        for won_column in clone_state.finished_columns:
-            if self._state.player_turn == won_column[1]:
-                won_columns += 1
         #This means if the player stop playing now, they will win the game
-        if won_columns == 3:
-            return True
-        else:
-            return False
+        return self._state.count_finished_after_n() == 3
 
     def are_there_available_columns_to_play(self):
         """
@@ -99,4 +149,4 @@ class Rule_of_28_Player_PS(Player):
         used AND there are available columns that are not finished/won yet.
         """
         available_columns = self.get_available_columns()
-        return self._state.n_neutral_markers != 3 and len(available_columns) > 0
+        return self._state.n_neutral_markers != 3 and len(available_columns) > 0
\ No newline at end of file
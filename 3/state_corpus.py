@@ -0,0 +1,320 @@
+import argparse
+import random
+import numpy as np
+from game import Game, DiceStream, FINISHED, WON
+from main_starter import play_match
+from DSL import BatchValue
+
+# Game settings of play_match, the only ones recorded
+GAME_SETTINGS = dict(n_players=2, dice_number=4, dice_value=6, column_range=[2,12],
+                     offset=2, initial_height=3)
+MAX_NEUTRALS = 3
+MAX_MOVES = 6
+
+def state_dtype(n_columns=13, n_markers=3, dice_number=4):
+    """
+    Return the record of one state:
+    - positions is the packed board of Board.positions.
+    - owner[c] is the player who finished column c, 0 if none.
+    - won[c] is the player who won column c this round, 0 if none.
+    - neutrals are the columns of neutral_positions in order, -1 padded.
+    - moves are the available dice moves, (c, -1) for a single column and
+      (-1, -1) as padding. Empty for 'y'/'n' decisions.
+    """
+
+    return np.dtype([('positions', np.uint8, (n_columns * n_markers,)),
+                     ('owner', np.uint8, (n_columns,)),
+                     ('won', np.uint8, (n_columns,)),
+                     ('neutrals', np.int8, (MAX_NEUTRALS,)),
+                     ('n_neutral', np.uint8),
+                     ('player_turn', np.uint8),
+                     ('dice_action', np.bool_),
+                     ('roll', np.uint8, (dice_number,)),
+                     ('moves', np.int8, (MAX_MOVES, 2)),
+                     ('n_moves', np.uint8)])
+
+def to_record(game, record):
+    """ Fill the numpy record 'record' with the state of 'game'. """
+
+    record['positions'] = np.frombuffer(game.board_game.positions, dtype=np.uint8)
+    owner = np.zeros(len(game.closed_columns), dtype=np.uint8)
+    for column_finished in game.finished_columns:
+        owner[column_finished[0]] = column_finished[1]
+    record['owner'] = owner
+    won = np.zeros(len(game.closed_columns), dtype=np.uint8)
+    for column_won in game.player_won_column:
+        won[column_won[0]] = column_won[1]
+    record['won'] = won
+    neutrals = [neutral[0] for neutral in game.neutral_positions]
+    record['neutrals'] = neutrals + [-1] * (MAX_NEUTRALS - len(neutrals))
+    record['n_neutral'] = game.n_neutral_markers
+    record['player_turn'] = game.player_turn
+    record['dice_action'] = game.dice_action
+    record['roll'] = game.current_roll
+    moves = np.full((MAX_MOVES, 2), -1, dtype=np.int8)
+    n_moves = 0
+    if game.dice_action:
+        for (i, move) in enumerate(game.available_moves()):
+            moves[i, :len(move)] = move
+            n_moves += 1
+    record['moves'] = moves
+    record['n_moves'] = n_moves
+
+class BatchStates:
+    def __init__(self, records):
+        """
+        Arrays over the states of state_dtype 'records', answering the
+        questions Rule_of_28_Player_PS and the DSL terminals ask a Game for
+        all the states at once.
+        """
+
+        template = Game(**GAME_SETTINGS)
+        self.column_range = template.column_range
+        self.heights = np.array(template.board_game.heights, dtype=np.int64)
+        self.n_states = len(records)
+        n_columns = records['owner'].shape[1]
+        cells = records['positions'].reshape(self.n_states, n_columns, -1).astype(np.int64) - 1
+        self.player_turn = records['player_turn'].astype(np.int64)
+        self.neutral_cells = cells[:, :, 0]
+        self.player_cells = cells[np.arange(self.n_states), :, self.player_turn]
+        self.owner = records['owner'].astype(np.int64)
+        self.won = records['won'].astype(np.int64)
+        self.neutrals = records['neutrals'].astype(np.int64)
+        self.n_neutral = records['n_neutral'].astype(np.int64)
+        self.dice_action = records['dice_action'].astype(bool)
+        self.moves = records['moves'].astype(np.int64)
+        self.n_moves = records['n_moves'].astype(np.int64)
+
+        # Game.number_advanced_this_round of every column
+        previously_conquered = self.player_cells
+        neutral_position = self.neutral_cells
+        won = (self.won != 0).astype(np.int64)
+        self.advanced = np.where((previously_conquered == -1) & (neutral_position != -1),
+                                 neutral_position + 1 + won,
+                        np.where((previously_conquered != -1) & (neutral_position != -1),
+                                 neutral_position - previously_conquered + won,
+                        np.where((previously_conquered != -1) & (neutral_position == -1),
+                                 won * (self.heights - previously_conquered), 0)))
+
+    def number_advanced_this_round(self, columns):
+        """
+        Return Game.number_advanced_this_round for an array of columns whose
+        first axis is the states (or of size 1), and where the columns are
+        off the board.
+        """
+
+        columns = np.broadcast_to(columns, (self.n_states,) + np.shape(columns)[1:])
+        outside = (columns < 0) | (columns >= self.advanced.shape[1])
+        index = np.clip(columns, 0, self.advanced.shape[1] - 1).reshape(self.n_states, -1)
+        return np.take_along_axis(self.advanced, index, axis=1).reshape(columns.shape), outside
+
+    def is_new_neutral(self, columns):
+        """ Return Game.is_new_neutral for an array of columns, as above. """
+
+        columns = np.broadcast_to(columns, (self.n_states,) + np.shape(columns)[1:])
+        shape = (self.n_states,) + (1,) * (columns.ndim - 1) + (MAX_NEUTRALS,)
+        neutrals = self.neutrals.reshape(shape)
+        return ~((columns[..., None] == neutrals) & (neutrals != -1)).any(axis=-1)
+
+    def count_finished_after_n(self):
+        """ Return Game.count_finished_after_n of every state. """
+
+        turn = self.player_turn[:, None]
+        return (self.owner == turn).sum(axis=1) + (self.won == turn).sum(axis=1)
+
+    def has_available_columns(self):
+        """ Return whether each state has Game.available_columns. """
+
+        columns = slice(self.column_range[0], self.column_range[1]+1)
+        return ((self.owner[:, columns] == 0) & (self.neutral_cells[:, columns] == -1)).any(axis=1)
+
+    def neutrals_value(self):
+        """ Return the 'neutrals' list of every state as a BatchValue. """
+
+        return BatchValue(self.neutrals, 1, 'list', [self.neutrals != -1], 'int')
+
+    def actions_value(self):
+        """
+        Return the available moves of every state as a BatchValue: lists of
+        columns, or ['y', 'n'] if no state has a dice action.
+        """
+
+        if self.dice_action.all():
+            exists = np.arange(MAX_MOVES)[None, :] < self.n_moves[:, None]
+            return BatchValue(self.moves, 1, 'list', [exists, (self.moves != -1) & exists[..., None]], 'int')
+        if not self.dice_action.any():
+            return BatchValue(np.zeros((self.n_states, 2), dtype=np.int64), 1, 'list',
+                              [np.ones((self.n_states, 2), dtype=bool)], 'str')
+        raise ValueError('states of both kinds of decision')
+
+    def action(self, state, index):
+        """ Return available move 'index' of 'state' as a tuple. """
+
+        return tuple(column for column in self.moves[state, index].tolist() if column != -1)
+
+class StateCorpus:
+    def __init__(self):
+        """
+        Game states recorded before the decisions of a player, to evaluate
+        strategy programs without playing matches.
+        - column_states are states where a dice combination is chosen.
+        - yes_no_states are states where 'y' or 'n' is chosen.
+        """
+
+        self.column_states = []
+        self.yes_no_states = []
+        self.batches = {}
+
+    def add(self, game):
+        """ Record a copy of 'game'. Used as the record hook of play_match. """
+
+        self.batches = {}
+        if game.dice_action:
+            self.column_states.append(game.clone())
+        else:
+            self.yes_no_states.append(game.clone())
+
+    def record_matches(self, p1, p2, n, seed=0):
+        """
+        Record the states of n match pairs between p1 and p2, seeded as
+        main_starter.play_seeded_matches. The state of the random module is
+        restored afterwards.
+        """
+
+        state = random.getstate()
+        try:
+            for pair in range(n):
+                random.seed(f'{seed}-{pair}')
+                dice = DiceStream(f'{seed}-{pair}-dice')
+                play_match(p1, p2, dice.restart(), self.add)
+                play_match(p2, p1, dice.restart(), self.add)
+        finally:
+            random.setstate(state)
+
+    def sample(self, max_states, seed=0):
+        """ Keep at most max_states states of each kind, chosen at random. """
+
+        rng = random.Random(seed)
+        self.batches = {}
+        if len(self.column_states) > max_states:
+            self.column_states = rng.sample(self.column_states, max_states)
+        if len(self.yes_no_states) > max_states:
+            self.yes_no_states = rng.sample(self.yes_no_states, max_states)
+
+    def batch_states(self, kind):
+        """ Return the BatchStates of the 'column' or 'yes_no' states. """
+
+        if kind not in self.batches:
+            states = self.column_states if kind == 'column' else self.yes_no_states
+            records = np.zeros(len(states), dtype=state_dtype())
+            for (i, game) in enumerate(states):
+                to_record(game, records[i])
+            self.batches[kind] = BatchStates(records)
+        return self.batches[kind]
+
+    def save(self, path):
+        """
+        Write the states, column states first, as one .npy array of
+        state_dtype records, which MappedCorpus maps back.
+        """
+
+        states = self.column_states + self.yes_no_states
+        records = np.zeros(len(states), dtype=state_dtype())
+        for (i, game) in enumerate(states):
+            to_record(game, records[i])
+        np.save(path, records)
+
+class GameViews:
+    def __init__(self, corpus, indexes):
+        """ List-like sequence of the Games of records 'indexes' of corpus. """
+
+        self.corpus = corpus
+        self.indexes = indexes
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __getitem__(self, i):
+        return self.corpus.game(self.indexes[i])
+
+    def __iter__(self):
+        for index in self.indexes:
+            yield self.corpus.game(index)
+
+class MappedCorpus:
+    def __init__(self, path):
+        """
+        Corpus saved by StateCorpus.save, memory-mapped read-only: processes
+        loading the same file share its pages. Games are built from the
+        records when accessed, with the same attributes as StateCorpus
+        states.
+        """
+
+        self.records = np.load(path, mmap_mode='r')
+        self.template = Game(**GAME_SETTINGS)
+        self.n_markers = self.template.board_game.n_markers
+        self.column_states = GameViews(self, np.flatnonzero(self.records['dice_action']))
+        self.yes_no_states = GameViews(self, np.flatnonzero(~self.records['dice_action']))
+        # BatchStates of each kind, built once
+        self.batches = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def batch_states(self, kind):
+        """ Return the BatchStates of the 'column' or 'yes_no' states. """
+
+        if kind not in self.batches:
+            states = self.column_states if kind == 'column' else self.yes_no_states
+            self.batches[kind] = BatchStates(self.records[states.indexes])
+        return self.batches[kind]
+
+    def game(self, index):
+        """ Return a Game in the state of record 'index'. """
+
+        record = self.records[index]
+        game = self.template.clone()
+        game.board_game.positions = bytearray(record['positions'].tobytes())
+        owner = record['owner'].tolist()
+        won = record['won'].tolist()
+        game.finished_columns = [(c, owner[c]) for c in range(len(owner)) if owner[c]]
+        game.player_won_column = [(c, won[c]) for c in range(len(won)) if won[c]]
+        game.closed_columns = bytearray((np.where(record['owner'] != 0, FINISHED, 0)
+                                         | np.where(record['won'] != 0, WON, 0)).astype(np.uint8).tobytes())
+        game.neutral_positions = [(c, game.board_game.get_position(c, 0))
+                                  for c in record['neutrals'].tolist() if c != -1]
+        game.n_neutral_markers = int(record['n_neutral'])
+        game.player_turn = int(record['player_turn'])
+        game.dice_action = bool(record['dice_action'])
+        game.current_roll = tuple(record['roll'].tolist())
+        return game
+
+    def moves(self, index):
+        """ Return the available moves recorded with state 'index'. """
+
+        record = self.records[index]
+        if not record['dice_action']:
+            return ['y', 'n']
+        return [tuple(c for c in move if c != -1) for move in record['moves'][:record['n_moves']].tolist()]
+
+if __name__ == "__main__":
+    from DSL import *
+    from random_player import RandomPlayer
+    from rule_of_28_sketch import Rule_of_28_Player_PS
+
+    parser = argparse.ArgumentParser(description='Record the decision states of random player vs Rule of 28 matches.')
+    parser.add_argument('output', help='.npy file to write')
+    parser.add_argument('--pairs', type=int, default=100, help='match pairs to record')
+    parser.add_argument('--states', type=int, default=None, help='states of each kind kept')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    pyn = Sum(Map(Function(Times(Plus(NumberAdvancedThisRound(), Constant(1)), VarScalarFromArray('progress_value'))), VarList('neutrals')))
+    pdc = Argmax(Map(Function(Sum(Map(Function(Minus(Times(NumberAdvancedByAction(), VarScalarFromArray('move_value')), Times(VarScalar('marker'), IsNewNeutral()))), None))), VarList('actions')))
+
+    corpus = StateCorpus()
+    corpus.record_matches(RandomPlayer(), Rule_of_28_Player_PS(pyn, pdc), args.pairs, args.seed)
+    if args.states is not None:
+        corpus.sample(args.states, args.seed)
+    corpus.save(args.output)
+    print(len(corpus.column_states), 'column states and', len(corpus.yes_no_states), 'yes-no states written to', args.output)
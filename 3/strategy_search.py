@@ -1,11 +1,16 @@
 import time
+import itertools
 from DSL import *
-from main_starter import play_n_matches
+from main_starter import MatchRunner, SPRT
 from tqdm import tqdm
 from rule_of_28_sketch import Rule_of_28_Player_PS
+from random_player import RandomPlayer
+from state_corpus import StateCorpus, MappedCorpus
 
 class DSBUS:
-    def __init__(self, size_bound, ibr_bound, grammar_constants, search_for):
+    def __init__(self, size_bound, ibr_bound, grammar_constants, search_for, runner=None,
+                 alpha=0.05, beta=0.05, step=5, prune=True, corpus_pairs=10, corpus_states=300,
+                 corpus_path=None, drop_levels=False):
         '''
         
         Parameters
@@ -16,6 +21,28 @@ class DSBUS:
             max number of IBR iterations.
         grammar_constants : dict
             dictionary of the grammar.
+        runner : MatchRunner
+            plays the evaluation matches. a serial one seeded with 0 if None.
+        alpha : float
+            probability of accepting a candidate that is not better.
+        beta : float
+            probability of rejecting a candidate that is better.
+        step : integer
+            match pairs played between two checks of the sequential tests.
+        prune : boolean
+            skip the programs deciding like an earlier one on a corpus of
+            recorded states.
+        corpus_pairs : integer
+            match pairs of a random player against the final boss recorded
+            for the corpus.
+        corpus_states : integer
+            states of each kind kept in the corpus.
+        corpus_path : string
+            .npy file written by state_corpus.py to use as the corpus
+            instead of recording one.
+        drop_levels : boolean
+            don't keep the program sizes that can't be part of a program
+            within size_bound.
 
         Returns
         -------
@@ -29,13 +56,33 @@ class DSBUS:
         self.ibr_bound = ibr_bound
         self.grammar_constants = grammar_constants
         self.search_for = search_for
+        self.runner = runner if runner is not None else MatchRunner(seed=0, workers=1)
+        self.step = step
+        # initial strategy: decisive (not drawn) games against itself,
+        # accepted at 60% as the fixed 100-game rule did
+        self.initial_test = SPRT(0.5, 0.7, alpha, beta)
+        self.initial_pairs = 50
+        self.initial_rate = 0.6
+        # IBR: games won against the best response, accepted at 55%
+        self.ibr_test = SPRT(0.5, 0.6, alpha, beta)
+        self.ibr_pairs = 500
+        self.ibr_rate = 0.55
+        self.prune = prune
+        self.corpus_pairs = corpus_pairs
+        self.corpus_states = corpus_states
+        self.corpus_path = corpus_path
+        self.drop_levels = drop_levels
     
-    # challenge the player from 'main_starter'
-    def final_challenge(self):
+    # the player from 'main_starter'
+    def final_boss(self):
         pyn = Sum(Map(Function(Times(Plus(NumberAdvancedThisRound(), Constant(1)), VarScalarFromArray('progress_value'))), VarList('neutrals')))
         pdc = Argmax(Map(Function(Sum(Map(Function(Minus(Times(NumberAdvancedByAction(), VarScalarFromArray('move_value')), Times(VarScalar('marker'), IsNewNeutral()))), None))), VarList('actions')))
-        final_boss = Rule_of_28_Player_PS(pyn, pdc)
-        brv, bossv = play_n_matches(self.best_response, final_boss, 1000)
+        return Rule_of_28_Player_PS(pyn, pdc)
+    
+    # challenge the player from 'main_starter'
+    def final_challenge(self):
+        final_boss = self.final_boss()
+        brv, bossv, _ = self.runner.play_n_matches(self.best_response, final_boss, 1000)
         print('----------')
         print('BOSS FIGHT!')
         print(brv, bossv)
@@ -43,6 +90,121 @@ class DSBUS:
         print('Boss: ', bossv / (brv + bossv))
         print('----------')
     
+    # play match pairs until 'test' decides or max_pairs are played
+    def sequential_eval(self, p1, p2, test, max_pairs, min_rate, decisive):
+        '''
+        
+        Parameters
+        ----------
+        p1 : Player
+            player whose success rate is tested.
+        p2 : Player
+            its opponent.
+        test : SPRT
+            sequential test on the success rate.
+        max_pairs : integer
+            match pairs played at most.
+        min_rate : float
+            success rate accepted if the test is undecided after max_pairs.
+        decisive : boolean
+            a success is a decisive game if True, a game won by p1 if False.
+
+        Returns
+        -------
+        accepted : boolean
+            whether the success rate is high enough.
+        rate : float
+            success rate over the games played.
+
+        '''
+        successes = 0
+        failures = 0
+        pairs = 0
+        decision = None
+        while decision is None and pairs < max_pairs:
+            n = min(self.step, max_pairs - pairs)
+            (p1v, p2v, draws) = self.runner.play_n_matches(p1, p2, n, self.crn_seed, pairs)
+            pairs += n
+            if decisive:
+                successes += p1v + p2v
+                failures += draws
+            else:
+                successes += p1v
+                failures += p2v
+            decision = test.decide(successes, failures)
+        self.pairs_played += pairs
+        rate = successes / max(successes + failures, 1)
+        if decision is None:
+            decision = rate >= min_rate
+        return decision, rate
+    
+    # decisions of a program on the corpus
+    def behaviour(self, program, kind):
+        '''
+        
+        Parameters
+        ----------
+        program : program
+            'Argmax' program if kind is 'column', 'Sum' program if 'yes_no'.
+        kind : string
+            which decision the program makes.
+
+        Returns
+        -------
+        tuple
+            action chosen in each corpus state of that kind, or the
+            exception type if the program fails on it.
+
+        '''
+        if kind == 'column':
+            player = Rule_of_28_Player_PS(None, program)
+            states = self.corpus.column_states
+        else:
+            player = Rule_of_28_Player_PS(program, None)
+            states = self.corpus.yes_no_states
+        # all the states at once, then one by one where needed
+        try:
+            decisions = player.get_actions_batch(self.corpus.batch_states(kind))
+        except NotImplementedError:
+            decisions = [None] * len(states)
+        actions = []
+        for (i, decision) in enumerate(decisions):
+            if isinstance(decision, type):
+                actions.append(decision.__name__)
+            elif decision is not None:
+                actions.append(decision)
+            else:
+                try:
+                    actions.append(player.get_action(states[i]))
+                except Exception as e:
+                    actions.append(type(e).__name__)
+        return tuple(actions)
+    
+    # keep one program per behaviour not seen before
+    def prune_programs(self, programs, kind):
+        '''
+        
+        Parameters
+        ----------
+        programs : iterable
+            programs in generation order.
+        kind : string
+            'column' or 'yes_no'.
+
+        Yields
+        ------
+        program
+            the first program of each behaviour not seen before.
+
+        '''
+        for program in programs:
+            behaviour = self.behaviour(program, kind)
+            if behaviour not in self.behaviours[kind]:
+                self.behaviours[kind].add(behaviour)
+                yield program
+            else:
+                self.progs_pruned += 1
+    
     # triage strategy evaluation
     def triage_eval(self, program_yes_no, program_decide_column):
         '''
@@ -62,17 +224,19 @@ class DSBUS:
         challenger = Rule_of_28_Player_PS(program_yes_no, program_decide_column)
         # find initial strategy
         if self.ibr_iteration < 0:
-            (p1v, p2v) = play_n_matches(challenger, challenger, 50)
+            accepted, rate = self.sequential_eval(challenger, challenger, self.initial_test,
+                                                  self.initial_pairs, self.initial_rate, True)
             self.progs_evaled += 1
-            if (p1v + p2v) >= 60:
+            if accepted:
                 self.ibr_iteration += 1
                 self.best_response = challenger
+                self.crn_seed = self.runner.next_seed()
                 self.program_decide_column = program_decide_column
                 self.program_yes_no = program_yes_no
                 # tqdm will mess up prints if a small pause is not taken before/after
                 time.sleep(0.2)
                 print(f'\nIBR iteration: {self.ibr_iteration}')
-                print(f'Decisive matches: {p1v + p2v}')
+                print(f'Decisive match rate: {rate}')
                 print('yes-no decision program:')
                 print(program_yes_no.toString())
                 print('column decision program')
@@ -80,37 +244,24 @@ class DSBUS:
                 self.final_challenge()
         # find IBR strategies
         else:
-            total_challenger_wins = 0
-            total_best_response_wins = 0
-            (chv, brv) = play_n_matches(challenger, self.best_response, 5)
+            accepted, rate = self.sequential_eval(challenger, self.best_response, self.ibr_test,
+                                                  self.ibr_pairs, self.ibr_rate, False)
             self.progs_evaled += 1
-            total_challenger_wins += chv
-            total_best_response_wins += brv
-            # wins 20% of first 10 matches
-            if total_challenger_wins / (total_challenger_wins + total_best_response_wins) >= 0.2:
-                (chv, brv) = play_n_matches(challenger, self.best_response, 95)
-                total_challenger_wins += chv
-                total_best_response_wins += brv
-                # wins 55% of first 200 matches
-                if total_challenger_wins / (total_challenger_wins + total_best_response_wins) >= 0.55:
-                    (chv, brv) = play_n_matches(challenger, self.best_response, 400)
-                    total_challenger_wins += chv
-                    total_best_response_wins += brv
-                    # wins 55% of first 1000 matches
-                    if total_challenger_wins / (total_challenger_wins + total_best_response_wins) >= 0.55:
-                        self.ibr_iteration += 1
-                        self.best_response = challenger
-                        self.program_decide_column = program_decide_column
-                        self.program_yes_no = program_yes_no
-                        time.sleep(0.2)
-                        print(f'\nIBR iteration: {self.ibr_iteration}')
-                        print('Challenger win rate:')
-                        print(total_challenger_wins / (total_challenger_wins + total_best_response_wins))
-                        print('yes-no decision program:')
-                        print(program_yes_no.toString())
-                        print('column decision program')
-                        print(program_decide_column.toString())
-                        self.final_challenge()
+            if accepted:
+                self.ibr_iteration += 1
+                self.best_response = challenger
+                self.crn_seed = self.runner.next_seed()
+                self.program_decide_column = program_decide_column
+                self.program_yes_no = program_yes_no
+                time.sleep(0.2)
+                print(f'\nIBR iteration: {self.ibr_iteration}')
+                print('Challenger win rate:')
+                print(rate)
+                print('yes-no decision program:')
+                print(program_yes_no.toString())
+                print('column decision program')
+                print(program_decide_column.toString())
+                self.final_challenge()
     
     def search(self):
         # number of programs generated
@@ -126,6 +277,9 @@ class DSBUS:
         # IBR iteration and best response
         self.ibr_iteration = -1
         self.best_response = None
+        # dice of the evaluation matches, shared by all the candidates
+        # evaluated against the same best response
+        self.crn_seed = self.runner.next_seed()
         
         # initial plist
         self.plist_noeval = {}
@@ -139,6 +293,15 @@ class DSBUS:
         # starting search size
         self.current_size = 1
         
+        # states to compare the behaviour of the programs on
+        if self.prune and self.corpus_path is not None:
+            self.corpus = MappedCorpus(self.corpus_path)
+        elif self.prune:
+            self.corpus = StateCorpus()
+            self.corpus.record_matches(RandomPlayer(), self.final_boss(), self.corpus_pairs)
+            self.corpus.sample(self.corpus_states)
+        self.behaviours = {'column': set(), 'yes_no': set()}
+        
         # update number of programs generated
         self.progs_generated += len(self.plist_noeval['l'][self.current_size])
         self.progs_generated += len(self.plist_noeval['e'][self.current_size])
@@ -147,14 +310,29 @@ class DSBUS:
         # the search
         while (self.current_size < self.size_bound) and (self.ibr_iteration < self.ibr_bound):
             self.progs_evaled = 0
+            self.pairs_played = 0
+            self.progs_pruned = 0
             self.current_size += 1
             print('**********')
             print(f'PROGRAM SIZE: {self.current_size}')
-            # get all new 'Argmax' and 'Sum' strats (if needed)
-            argmax_list, sum_list = self.generate_new_programs()
+            # new 'Argmax' and 'Sum' strats (if needed), evaluated as they
+            # are generated
+            if self.search_for == 'both':
+                column_programs, yes_no_programs = itertools.tee(self.generate_new_programs())
+                argmax_list = (program for (program, _) in column_programs)
+                sum_list = (program for (_, program) in yes_no_programs)
+                if self.prune:
+                    sum_list = self.prune_programs(sum_list, 'yes_no')
+            elif self.search_for == 'column':
+                argmax_list = (program for (program, _) in self.generate_new_programs())
+                sum_list = [self.program_yes_no]
+            if self.prune:
+                argmax_list = self.prune_programs(argmax_list, 'column')
             # tqdm will mess up prints if a small pause is not taken before/after
             time.sleep(0.2)
             if self.ibr_iteration < 0:
+                # every yes-no program is paired with each column program
+                sum_list = list(sum_list)
                 for program_decide_column in tqdm(argmax_list):
                     for program_yes_no in sum_list:
                         # some programs don't work, so use a try-except block
@@ -178,124 +356,114 @@ class DSBUS:
                     except:
                         pass
             time.sleep(0.2)
+            print(f'PROGRAMS PRUNED: {self.progs_pruned}')
             print(f'PROGRAMS EVALUATED: {self.progs_evaled}')
+            print(f'MATCH PAIRS PLAYED: {self.pairs_played}')
     
-    # generate new programs
-    def generate_new_programs(self):       
-        # strategy lists
-        argmax_list = []
-        sum_list = []
-        
-        ### lists
-        # argmax, sum
-        as_set = set()
-        as_list = []
-        # plus, times, minus
-        ptm_set = set()
-        ptm_list = []
-        # map
-        map_set = set()
-        map_list = []
-        # map, None
-        mapnone_set = set()
-        mapnone_list = []
-        
-        ### valid program sizes
-        # argmax, sum
-        for size1 in self.plist_noeval['l'].keys():
-            if size1 + 1 == self.current_size:
-                new_tuple = size1
-                if new_tuple not in as_set:
-                    as_set.add(new_tuple)
-                    as_list.append(new_tuple)
-        # plus, times, minus
-        for size1 in self.plist_noeval['s'].keys():
-            for size2 in self.plist_noeval['s'].keys():
-                if size1 + size2 + 1 == self.current_size:
-                    new_tuple = tuple((size1, size2))
-                    if new_tuple not in ptm_set:
-                        ptm_set.add(new_tuple)
-                        ptm_list.append(new_tuple)
-        # map
-        for size1 in self.plist_noeval['e'].keys():
-            for size2 in self.plist_noeval['l'].keys():
-                if size1 + size2 + 2 == self.current_size:
-                    new_tuple = tuple((size1, size2))
-                    if new_tuple not in map_set:
-                        map_set.add(new_tuple)
-                        map_list.append(new_tuple)
-        # map, None
-        for size1 in self.plist_noeval['e'].keys():
-            if size1 + 2 == self.current_size:
-                new_tuple = size1
-                if new_tuple not in mapnone_set:
-                    mapnone_set.add(new_tuple)
-                    mapnone_list.append(new_tuple)
-        
-        ### create new lists in program list if needed
-        if as_list or ptm_list or map_list or mapnone_list:
-            self.plist_noeval['e'][self.current_size] = []
-        if map_list or mapnone_list:
-            self.plist_noeval['l'][self.current_size] = []
+    # whether programs of 'size' in plist_noeval[kind] can be part of a
+    # program within size_bound
+    def keeps_level(self, kind, size):
+        if not self.drop_levels:
+            return True
+        # 'e' programs are mapped over a list ('None' at least) and 'l'
+        # programs are mapped over by an 'e' program of size 1 at least
+        if kind == 'e':
+            return size + 3 <= self.size_bound
+        return size + 4 <= self.size_bound
+    
+    # add a program to plist_noeval if its size is kept
+    def add_program(self, kind, size, program):
+        if self.keeps_level(kind, size):
+            self.plist_noeval[kind].setdefault(size, []).append(program)
+    
+    # generate the 'Plus', 'Times', 'Minus' and 'Map' programs of a size
+    def generate_level(self, size):
+        '''
         
-        ### generate programs
-        # argmax, sum
-        for size1 in as_list:
-            for l in self.plist_noeval['l'][size1]:
-                argmax_list.append(Argmax(l))
-                # only add to 'sum list' if searching for both strategies
-                if self.search_for == 'both':
-                    sum_list.append(Sum(l))
-                self.plist_noeval['e'][self.current_size].append(Sum(l))
+        Parameters
+        ----------
+        size : integer
+            size of the programs. the 'Sum' programs of that size are
+            generated with the candidates of that size.
+
+        Yields
+        ------
+        program
+            the new 'Map' programs, which are the lists of that size.
+
+        '''
         # plus, times, minus
-        for (size1, size2) in ptm_list:
-            for s1 in self.plist_noeval['s'][size1]:
-                for s2 in self.plist_noeval['s'][size2]:
-                    self.plist_noeval['e'][self.current_size].append(Plus(s1, s2))
-                    self.plist_noeval['e'][self.current_size].append(Times(s1, s2))
-                    self.plist_noeval['e'][self.current_size].append(Minus(s1, s2))
-        # map
-        for (size1, size2) in map_list:
-            for e in self.plist_noeval['e'][size1]:
-                for l in self.plist_noeval['l'][size2]:
-                    self.plist_noeval['e'][self.current_size].append(Map(Function(e), l))
-                    self.plist_noeval['l'][self.current_size].append(Map(Function(e), l))
+        if self.keeps_level('e', size):
+            for size1 in list(self.plist_noeval['s'].keys()):
+                for size2 in list(self.plist_noeval['s'].keys()):
+                    if size1 + size2 + 1 == size:
+                        for s1 in self.plist_noeval['s'][size1]:
+                            for s2 in self.plist_noeval['s'][size2]:
+                                self.add_program('e', size, Plus(s1, s2))
+                                self.add_program('e', size, Times(s1, s2))
+                                self.add_program('e', size, Minus(s1, s2))
+                                self.progs_generated += 3
+        # map (the same node is an 'e' and an 'l' program)
+        for size1 in list(self.plist_noeval['e'].keys()):
+            size2 = size - size1 - 2
+            if size2 in self.plist_noeval['l']:
+                for e in self.plist_noeval['e'][size1]:
+                    for l in self.plist_noeval['l'][size2]:
+                        program = Map(Function(e), l)
+                        self.add_program('e', size, program)
+                        self.add_program('l', size, program)
+                        self.progs_generated += 1
+                        yield program
         # map, None
-        for size in mapnone_list:
-            for e in self.plist_noeval['e'][size1]:
-                self.plist_noeval['e'][self.current_size].append(Map(Function(e), None))
-                self.plist_noeval['l'][self.current_size].append(Map(Function(e), None))
-        
-        # update number of programs generated
-        if as_list or ptm_list or map_list or mapnone_list:
-            self.progs_generated += len(self.plist_noeval['e'][self.current_size])
-            self.progs_generated += len(argmax_list)
-            self.progs_generated += len(sum_list)
-        if map_list or mapnone_list:
-            self.progs_generated += len(self.plist_noeval['l'][self.current_size])
+        if size - 2 in self.plist_noeval['e']:
+            for e in self.plist_noeval['e'][size - 2]:
+                program = Map(Function(e), None)
+                self.add_program('e', size, program)
+                self.add_program('l', size, program)
+                self.progs_generated += 1
+                yield program
+    
+    # generate new programs
+    def generate_new_programs(self):
+        '''
         
-        ### return
-        if self.search_for == 'both':
-            return argmax_list, sum_list
-        elif self.search_for == 'column':
-            return argmax_list, [self.program_yes_no]
+        Yields
+        ------
+        tuple
+            'Argmax' and 'Sum' programs of the current size over the same
+            list. the lists are generated along the way.
+
+        '''
+        if self.current_size - 1 in self.plist_noeval['l']:
+            lists = iter(self.plist_noeval['l'][self.current_size - 1])
+        else:
+            lists = self.generate_level(self.current_size - 1)
+        for l in lists:
+            program_sum = Sum(l)
+            self.add_program('e', self.current_size, program_sum)
+            self.progs_generated += 2
+            yield Argmax(l), program_sum
              
 
-# grammar
-grammar_constants = {}
-grammar_constants['l'] = [VarList('neutrals'), VarList('actions')]
-grammar_constants['s'] = [VarScalarFromArray('progress_value'),
-                          VarScalarFromArray('move_value'),
-                          NumberAdvancedThisRound(), NumberAdvancedByAction(),
-                          IsNewNeutral(), VarScalar('marker'), Constant(1)]
+if __name__ == "__main__":
+    # grammar
+    grammar_constants = {}
+    grammar_constants['l'] = [VarList('neutrals'), VarList('actions')]
+    grammar_constants['s'] = [VarScalarFromArray('progress_value'),
+                              VarScalarFromArray('move_value'),
+                              NumberAdvancedThisRound(), NumberAdvancedByAction(),
+                              IsNewNeutral(), VarScalar('marker'), Constant(1)]
 
-### INPUTS
-size_bound = 11
-ibr_bound = 5
-search_for = 'both'
+    ### INPUTS
+    size_bound = 11
+    ibr_bound = 5
+    search_for = 'both'
 
-# running the search
-synthesizer = DSBUS(size_bound, ibr_bound, grammar_constants, search_for)
-synthesizer.search()
-print('TOTAL PROGRAMS GENERATED:')
-print(synthesizer.progs_generated)
\ No newline at end of file
+    # running the search
+    # evaluation matches over all cores, reproducible from the seed
+    runner = MatchRunner(seed=0)
+    synthesizer = DSBUS(size_bound, ibr_bound, grammar_constants, search_for, runner)
+    synthesizer.search()
+    runner.close()
+    print('TOTAL PROGRAMS GENERATED:')
+    print(synthesizer.progs_generated)
\ No newline at end of file